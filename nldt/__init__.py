@@ -13,7 +13,10 @@ NLDT Rules
 
  * The basic time representation is an epoch, which is a 64 bit int
    representing the number of seconds since Thu Jan 1 00:00:00 1970 UTC. Epoch
-   values always reflect UTC (not local) time.
+   values always reflect UTC (not local) time. Underneath, moments and
+   durations count nanoseconds, so that events less than a second apart keep
+   their order; epoch() and the other second-based methods report whole
+   seconds.
 
  * NLDT stores epoch values in objects of moment class, which provides a number
    of useful methods.
@@ -63,31 +66,85 @@ The better solution is to import and use calendar.timegm() because it provides
 the desired functionality, converting a UTC tm struct to the corresponding UTC
 epoch.
 """
+import array
+import bisect
 import calendar
+import collections
 import contextlib
+import copyreg
 from datetime import datetime
 from tzlocal import get_localzone
 import inspect
+import itertools
+import math
 from nldt import numberize
 import numbers
+import operator
 import os
 # import pdb
 import pytz
 import re
 from nldt.text import txt
+import threading
 import time
+import types
 from nldt import verinfo
+try:
+    import zoneinfo
+except ImportError:                                     # pragma: no cover
+    zoneinfo = None
+
+_lexicon = None
+_CLOCK_UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_ISO = re.compile(r"(\d{4})-(\d\d)-(\d\d)"
+                  r"(?:[Tt ](\d\d)(?::(\d\d)(?::(\d\d)(?:[.,](\d+))?)?"
+                  r"(?:([Zz])|([+-])(\d\d)(?::?(\d\d))?)?)?)?", re.ASCII)
+_ISO_DAYS = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+_SHAPE_ALPHA = re.compile(r"[^\W\d_]+")
+_SHAPE_DIGITS = re.compile(r"\d+")
+_SHAPE_SPACE = re.compile(r"\s+")
+_STARTS = {}
+_STRFTIME = re.compile(r"%.|[^%]+|%", re.DOTALL)
+_STRFTIME_SPELLED = {'%F': '%Y-%m-%d', '%T': '%H:%M:%S'}
+_STRFTIME_SUBSEC = {'%f': '{0:06d}', '%N': '{1:09d}'}
+_ZONES = {}
+_ZONE_HORIZON = 2114380800                  # 2037-01-01, where pytz stops
+_ARRAY_TYPES = ('DurationArray', 'MomentArray')
+
+
+# -----------------------------------------------------------------------------
+class _Local(threading.local):
+    """
+    Per-thread state, so that calls running in different threads do not see
+    each other's instrumentation records. *tally* is the record of the
+    instrumented Parser call running in the thread, if any.
+    """
+    record = None
+    tally = None
+
+
+_local = _Local()
 
 
 # -----------------------------------------------------------------------------
 class duration(object):
     """
-    This class represents a time interval by storing the number of seconds in
-    the interval.
+    This class represents a time interval by storing the number of nanoseconds
+    in the interval as an int. Instances have no __dict__, only the ns slot.
+    The seconds attribute reports the interval in seconds, an int if it is a
+    whole number of seconds and a float otherwise.
+
+    Durations compare with each other and with numbers of seconds, and hash
+    like their seconds value, so they work with sorted(), bisect, heapq,
+    min(), max(), sets, and dict keys. For large sorts, key=duration.sort_key
+    compares plain ints and skips the Python comparison methods.
     """
+    __slots__ = ('ns',)
+    sort_key = operator.attrgetter('ns')
+
     def __init__(self, start=None, end=None,
                  years=None, weeks=None, days=None, hours=None, minutes=None,
-                 seconds=None):
+                 seconds=None, nanoseconds=None):
         """
         If *start* or *end* are present, both must be, and none of the other
         arguments are allowed. Each can be in any of the following formats: 1)
@@ -97,7 +154,8 @@ class duration(object):
         example.
 
         If *start* and *end* are both absent, any combination of *years*,
-        *weeks*, *days*, *hours*, *minutes*, and *seconds* can be used.
+        *weeks*, *days*, *hours*, *minutes*, *seconds*, and *nanoseconds* can
+        be used. Fractions of a second are kept to the nanosecond.
         """
         if start or end:
             # build duration from the difference between end and start
@@ -105,7 +163,7 @@ class duration(object):
                 raise InitError(txt['mctor-001'])
             start = self._resolve_value(start)
             end = self._resolve_value(end)
-            self.seconds = end.epoch() - start.epoch()
+            self.ns = end.ns - start.ns
         else:
             # build duration from years, weeks, days, hours, minutes, seconds
             tsecs = 0
@@ -122,7 +180,35 @@ class duration(object):
                 tsecs += tu.magnitude('week') * weeks
             if years:
                 tsecs += tu.magnitude('year') * years
-            self.seconds = tsecs
+            self.ns = _ns(tsecs) + int(nanoseconds or 0)
+
+    # -------------------------------------------------------------------------
+    @property
+    def seconds(self):
+        """
+        The interval in seconds: an int for a whole number of seconds, a float
+        otherwise (class duration)
+        """
+        whole, frac = divmod(self.ns, 1000000000)
+        return self.ns / 1000000000 if frac else whole
+
+    # -------------------------------------------------------------------------
+    @seconds.setter
+    def seconds(self, value):
+        """
+        Sets the interval to *value* seconds (class duration)
+        """
+        self.ns = _ns(value)
+
+    # -------------------------------------------------------------------------
+    def __reduce__(self):
+        """
+        Pickles a duration as its class and nanosecond count, which is all a
+        record takes. Unpickling skips __init__ and hands the count to
+        __setstate__(). Protocols 0 and 1, which cannot pickle slots on their
+        own, work too. (class duration)
+        """
+        return (copyreg.__newobj__, (type(self),), self.ns)
 
     # -------------------------------------------------------------------------
     def __repr__(self):
@@ -130,16 +216,28 @@ class duration(object):
         Return an object representation suitable to be processed by eval (class
         duration)
         """
+        if self.ns % 1000000000:
+            return "{}.{}(nanoseconds={})".format(self.__module__,
+                                                  self.__class__.__name__,
+                                                  self.ns)
         return "{}.{}(seconds={})".format(self.__module__,
                                           self.__class__.__name__,
                                           self.seconds)
 
+    # -------------------------------------------------------------------------
+    def __setstate__(self, count):
+        """
+        Unpickles a duration from the nanosecond *count* __reduce__() saved
+        (class duration)
+        """
+        self.ns = count
+
     # -------------------------------------------------------------------------
     def __str__(self):
         """
         Return the objects str suitable human consumption (class duration)
         """
-        secs = self.seconds
+        secs = int(self.seconds)
         days = int(secs / (3600 * 24))
         secs -= days * 3600 * 24
         hours = int(secs / 3600)
@@ -158,11 +256,13 @@ class duration(object):
         (class duration)
         """
         if isinstance(other, duration):
-            rval = duration(seconds=self.seconds + other.seconds)
+            rval = duration._from_ns(self.ns + other.ns)
         elif isinstance(other, numbers.Number):
-            rval = duration(seconds=self.seconds + other)
+            rval = duration._from_ns(self.ns + _ns(other))
         elif isinstance(other, moment):
-            rval = moment(other + self.seconds)
+            rval = other + self
+        elif _defers(other):
+            rval = NotImplemented
         else:
             other = moment(other)
             rval = other + self
@@ -189,10 +289,56 @@ class duration(object):
         Assess whether this object is equal to the *other* value (class
         duration)
         """
-        if isinstance(other, numbers.Number):
+        if type(other) is duration:
+            return self.ns == other.ns
+        elif isinstance(other, numbers.Number):
             return self.seconds == other
         elif isinstance(other, duration):
-            return self.seconds == other.seconds
+            return self.ns == other.ns
+
+    # -------------------------------------------------------------------------
+    def __ge__(self, other):
+        """
+        Is *self* at least as long as *other*? (class duration)
+        """
+        if type(other) is duration:
+            return self.ns >= other.ns
+        return self._order(other, operator.ge)
+
+    # -------------------------------------------------------------------------
+    def __gt__(self, other):
+        """
+        Is *self* longer than *other*? (class duration)
+        """
+        if type(other) is duration:
+            return self.ns > other.ns
+        return self._order(other, operator.gt)
+
+    # -------------------------------------------------------------------------
+    def __hash__(self):
+        """
+        Hash like the seconds value, so that a duration and the number it
+        equals land on the same dict key (class duration)
+        """
+        return hash(self.seconds)
+
+    # -------------------------------------------------------------------------
+    def __le__(self, other):
+        """
+        Is *self* at most as long as *other*? (class duration)
+        """
+        if type(other) is duration:
+            return self.ns <= other.ns
+        return self._order(other, operator.le)
+
+    # -------------------------------------------------------------------------
+    def __lt__(self, other):
+        """
+        Is *self* shorter than *other*? (class duration)
+        """
+        if type(other) is duration:
+            return self.ns < other.ns
+        return self._order(other, operator.lt)
 
     # -------------------------------------------------------------------------
     def __sub__(self, other):
@@ -203,12 +349,14 @@ class duration(object):
           - duration - moment => exception
         (class duration)
         """
-        if isinstance(other, numbers.Number):
-            rval = self.seconds - other
-        elif isinstance(other, duration):
-            rval = self.seconds - other.seconds
+        if isinstance(other, duration):
+            rval = duration._from_ns(self.ns - other.ns)
+        elif isinstance(other, numbers.Number):
+            rval = duration._from_ns(self.ns - _ns(other))
         elif isinstance(other, moment):
             raise TypeError(txt['optypes-01'])
+        elif _defers(other):
+            rval = NotImplemented
         else:
             raise TypeError(txt['optypes-02'].format(type(self), type(other)))
         return rval
@@ -232,6 +380,43 @@ class duration(object):
         rval["S"] = int(secs)
         return rval
 
+    # -------------------------------------------------------------------------
+    @classmethod
+    def _from_ns(cls, count):
+        """
+        Returns a duration of *count* nanoseconds without going through
+        __init__. For internal arithmetic, where *count* is already known to
+        be an int. (class duration)
+        """
+        rval = object.__new__(cls)
+        rval.ns = count
+        return rval
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def _from_seconds(cls, seconds):
+        """
+        Returns a duration of *seconds* without going through __init__. For
+        internal arithmetic, where *seconds* is already known to be a number.
+        (class duration)
+        """
+        rval = object.__new__(cls)
+        rval.ns = _ns(seconds)
+        return rval
+
+    # -------------------------------------------------------------------------
+    def _order(self, other, op):
+        """
+        Applies comparison *op* to *self* and *other*, a duration (of a
+        subclass) or a number of seconds. Anything else is NotImplemented.
+        (class duration)
+        """
+        if isinstance(other, duration):
+            return op(self.ns, other.ns)
+        elif isinstance(other, numbers.Number):
+            return op(self.ns, _ns(other))
+        return NotImplemented
+
     # -------------------------------------------------------------------------
     def _resolve_value(self, start_end_value):
         """
@@ -267,7 +452,7 @@ class duration(object):
         This method reports a duration as <days>.HH:MM:SS in a string (class
         duration)
         """
-        secs = self.seconds
+        secs = int(self.seconds)
         days = int(secs / (24*3600))
         secs -= days * 24 * 3600
         hours = int(secs / 3600)
@@ -282,7 +467,7 @@ class duration(object):
         """
         This method reports a duration as HH:MM:SS in a string (class duration)
         """
-        secs = abs(self.seconds)
+        secs = abs(int(self.seconds))
         hours = int(secs / 3600)
         secs -= hours * 3600
         minutes = int(secs / 60)
@@ -307,6 +492,10 @@ class Indexable(object):
     will take an argument that may be a number or string and return a numeric
     index for one of the members of _dict. This class is intended as an
     abstract base class for week and month.
+
+    Subclasses also set _alias, a read-only map from every accepted spelling
+    of a member (full name, abbreviation, prefixes of the name longer than the
+    abbreviation, digit strings, and ints) to its index. Keys are lowercase.
     """
     # -------------------------------------------------------------------------
     def __init__(self):
@@ -319,31 +508,40 @@ class Indexable(object):
     # -------------------------------------------------------------------------
     def indexify(self, name_or_idx):
         """
-        Return an int idx in the range [0, 7) (i.e., between 0 and 6 inclusive)
-        or -1. (class Indexable)
+        Return the int index of the member named by *name_or_idx* or raise
+        ValueError. Normalized input ('mon', 'october', 3, '5') is found with
+        a single probe of self._alias. Otherwise, strings are lowercased,
+        numbers are truncated to int, and the alias map is probed again.
+        (class Indexable)
         """
+        try:
+            return self._alias[name_or_idx]
+        except (KeyError, TypeError):
+            pass
+
         rval = None
-        if name_or_idx in self._dict:
-            rval = self._dict[name_or_idx]['idx']
-        elif isinstance(name_or_idx, str):
-            name_or_idx = name_or_idx.lower()
-            if name_or_idx.isdigit():
-                idx = int(name_or_idx)
-                if idx in self._dict:
-                    rval = self._dict[idx]['idx']
-            elif 3 < len(name_or_idx):
-                abbr = name_or_idx.lower()[0:3]
-                if abbr in self._dict:
-                    rval = self._dict[abbr]['idx']
-            elif name_or_idx in self._dict:
-                rval = self._dict[name_or_idx]['idx']
+        if isinstance(name_or_idx, str):
+            key = name_or_idx.lower()
+            if key.isdigit():
+                key = int(key)
+            rval = self._alias.get(key)
+            if rval is None and 3 < len(name_or_idx):
+                rval = self._alias.get(key[0:3])
         elif isinstance(name_or_idx, numbers.Number):
-            if int(name_or_idx) in self._dict:
-                rval = self._dict[int(name_or_idx)]['idx']
+            rval = self._alias.get(int(name_or_idx))
         if rval is None:
             raise ValueError(txt['not-indxfy'].format(name_or_idx))
         return rval
 
+    # -------------------------------------------------------------------------
+    def aliases(self):
+        """
+        Returns the read-only map from each accepted spelling of a member to
+        its index. Callers that translate many names at once can use it
+        directly. (class Indexable)
+        """
+        return self._alias
+
 
 # -----------------------------------------------------------------------------
 class timezone(object):
@@ -367,16 +565,17 @@ class timezone(object):
         if tz == 'local':
             self._tzinfo = get_localzone()
             self._zone = 'local'
-            ctx_zone = self._tzinfo.zone
         else:
             self._tzinfo = pytz.timezone(tz)
             self._zone = self._tzinfo.zone
-            ctx_zone = tz
-        with tz_context(ctx_zone):
-            self._timezone = time.timezone
-            self._altzone = time.altzone
-            self._daylight = time.daylight
-            self._tzname = time.tzname
+        offl = offset_list(self._tzinfo.zone)
+        std = offl['std']
+        dst = offl.get('dst', std)
+        self._timezone = -1 * int(std['secs'])
+        self._altzone = -1 * int(dst['secs'])
+        self._daylight = int('dst' in offl)
+        self._tzname = tuple('XXX' if isnum(x['name']) else x['name']
+                             for x in (std, dst))
 
     # -------------------------------------------------------------------------
     def std_offset(self):
@@ -439,7 +638,33 @@ class moment(object):
     Objects of this class represent a point in time. The moment is stored in
     UTC. The strptime formats in list moment.formats are used to intuit the
     format of date/time strings for which no format is provided.
+
+    Up to moment.reject_size strings that matched none of the formats are
+    remembered in moment.rejects, so a string that is known to fail is turned
+    away without trying all of the formats again (see reject_info()).
+
+    Rather than trying the formats one by one, a string is first reduced to
+    its shape (see _shape()) and only the formats with the same shape are
+    tried, which is normally just one. The format that last matched each
+    shape is remembered in moment.learned (up to moment.learned_size shapes)
+    and tried before any other, so a stream of strings in one format costs one
+    attempt each after the first. Only formats that cannot change the result
+    are learned (see _learnable()), so a string means the same thing whatever
+    was read before it. See shape_memory() for saving and loading what has
+    been learned.
+
+    Instances have no __dict__, only the ns slot holding the nanoseconds since
+    the epoch as an int. The moment attribute and epoch() report whole seconds
+    (rounded down). Arithmetic results are built by _from_epoch() and
+    from_ns(), which skip the argument checks in __init__().
+
+    Moments are ordered and hashed by their nanosecond count, so they work with
+    sorted(), bisect, heapq, min(), max(), sets, and dict keys. Comparing two
+    moments is a single int comparison. For large sorts, key=moment.sort_key
+    compares plain ints and skips the Python comparison methods.
     """
+    __slots__ = ('ns',)
+    sort_key = operator.attrgetter('ns')
     formats = ['%y-%m-%d',
                '%y-%m-%d %H',
                '%y-%m-%d %H:%M',
@@ -455,11 +680,6 @@ class moment(object):
                "%Y.%m%d %H:%M",
                "%Y.%m%d %H:%M:%S",
 
-               "%Y-%m-%d",
-               "%Y-%m-%d %H",
-               "%Y-%m-%d %H:%M",
-               "%Y-%m-%d %H:%M:%S",
-
                "%b %d %Y",
                "%b %d %Y %H",
                "%b %d %Y %H:%M",
@@ -500,6 +720,17 @@ class moment(object):
                "%d %B, %Y %H",
                "%d %B, %Y",
                ]
+    reject_size = 1024
+    rejects = collections.OrderedDict()
+    reject_counts = {'rejected': 0, 'failed': 0}
+    reject_formats = None
+    shapes = None
+    shape_formats = None
+    learned = {}
+    learned_size = 256
+    formatters = {}
+    formatter_size = 256
+    lock = threading.Lock()
 
     # -------------------------------------------------------------------------
     @classmethod
@@ -524,6 +755,66 @@ class moment(object):
             cls.deftz = value
         return rval
 
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_ns(cls, count):
+        """
+        Returns the moment *count* nanoseconds after the epoch (class moment)
+        """
+        rval = object.__new__(cls)
+        rval.ns = int(count)
+        return rval
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def now_ns(cls):
+        """
+        Returns the current moment to the nanosecond. moment() with no
+        argument stays at the whole second. (class moment)
+        """
+        rval = object.__new__(cls)
+        rval.ns = time.time_ns()
+        return rval
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def reject_info(cls):
+        """
+        Returns a dict reporting how many date/time strings were turned away
+        from moment.rejects, how many failed against every format, and the
+        current and maximum number of rejects remembered (class moment)
+        """
+        with cls.lock:
+            rval = dict(cls.reject_counts)
+            rval.update({'size': len(cls.rejects), 'maxsize': cls.reject_size})
+        return rval
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def shape_memory(cls, table=None):
+        """
+        If *table* is None, return a copy of the learned table, a dict mapping
+        each shape to the format that last matched it, without changing it. If
+        *table* is 'clear', forget everything learned. Otherwise, *table* is a
+        dict like the ones returned here (from another process, say) and its
+        entries are added to what has been learned, except those that
+        _learnable() turns down. The copy of the table is returned in every
+        case (class moment)
+        """
+        with cls.lock:
+            rval = dict(cls.learned)
+        if table == 'clear':
+            with cls.lock:
+                cls.learned = {}
+        elif table:
+            if cls.shape_formats != cls.formats:
+                cls._shape_table(cls.formats)
+            for shape, fmt in table.items():
+                if not isinstance(shape, str) or not isinstance(fmt, str):
+                    raise TypeError(txt['shape-mem'])
+                cls._learn(shape, fmt)
+        return rval
+
     # -------------------------------------------------------------------------
     @classmethod
     def takes_tz(cls, value):
@@ -568,6 +859,13 @@ class moment(object):
         computer unless class method moment.default_tz() is called to change
         it.
 
+        ISO 8601 / RFC 3339 strings ('2018-02-16 11:49:13',
+        '2018-02-16T11:49:13.123+02:00') are read directly rather than through
+        moment.formats. If such a string ends in 'Z' or a UTC offset, that
+        offset is used and *itz* is ignored. Fractions of a second are kept
+        to the nanosecond, as they are for a *fmt* containing %f. Numbers are
+        whole seconds, as they always were; use from_ns() for more precision.
+
         Examples:
             >>> import nldt
             # current time
@@ -598,22 +896,19 @@ class moment(object):
 
         if not hasattr(self.__class__, 'deftz'):
             self.__class__.deftz = 'local'
-        self.moment = None
         if dspec is None:
             if itz or fmt:
                 raise InitError(txt['no-args'])
             else:
-                self.moment = int(time.time())
-        elif any([isinstance(dspec, numbers.Number),
-                  isinstance(dspec, str) and dspec.isdigit(),
-                  isinstance(dspec, moment)
-                  ]):
+                self.ns = int(time.time()) * 1000000000
+        elif (isinstance(dspec, (numbers.Number, moment)) or
+              isinstance(dspec, str) and dspec.isdigit()):
             if itz or fmt:
                 raise ValueError(txt['epc-nofmttz'])
             elif isinstance(dspec, moment):
-                self.moment = dspec.epoch()
+                self.ns = dspec.ns
             else:
-                self.moment = int(dspec)
+                self.ns = int(dspec) * 1000000000
         elif isinstance(dspec, time.struct_time):
             if fmt:
                 raise InitError(txt['fmt-str'])
@@ -637,18 +932,33 @@ class moment(object):
             if fmt:
                 fmt = fmt.replace("%F", "%Y-%m-%d")
                 fmt = fmt.replace("%T", "%H:%M:%S")
-                when = timegm(time.strptime(dspec, fmt))
+                if _local.tally is not None:
+                    _local.tally['strptime'] += 1
+                if '%f' in fmt:
+                    when = datetime.strptime(dspec, fmt)
+                    frac = when.microsecond * 1000
+                    when = timegm(when.timetuple())
+                else:
+                    when = timegm(time.strptime(dspec, fmt))
+                    frac = 0
                 if itz:
                     self.moment = self._normalize(when, tz=itz)
                 else:
                     self.moment = self._normalize(when,
                                                   tz=self.__class__.deftz)
-            elif itz:
-                self.moment = self._normalize(self._guess_format(dspec),
-                                              tz=itz)
+                self.ns += frac
             else:
-                self.moment = self._normalize(self._guess_format(dspec),
-                                              tz=self.__class__.deftz)
+                iso = _iso_epoch(dspec)
+                if iso is None:
+                    iso = (self._guess_format(dspec), None, 0)
+                when, offset, frac = iso
+                if offset is None:
+                    self.moment = self._normalize(when,
+                                                  tz=itz or
+                                                  self.__class__.deftz)
+                else:
+                    self.moment = when - offset
+                self.ns += frac
         else:
             raise ValueError(txt['valid-calls'])
 
@@ -663,6 +973,13 @@ class moment(object):
         *otz*: Optional timezone indicating that the date/time in the output
         string should be localized to the specified timezone.
 
+        Each format string is prepared once (see _formatter()). For a named
+        *otz*, the offset and zone name in effect at the moment come from the
+        zone's transition table (see _zone_info()), and %Z and %z are filled
+        in by time.strftime() from the broken-down time. Besides the
+        time.strftime() directives, %f gives the microseconds (six digits, as
+        in datetime) and %N the nanoseconds (nine digits, as in GNU date).
+
         Examples:
             >>> import nldt
             >>> a = nldt.moment()
@@ -676,21 +993,38 @@ class moment(object):
 
         (class moment)
         """
-        fmt = fmt or "%Y-%m-%d"
+        fmt, zoned, subsec = self._formatter(fmt or "%Y-%m-%d")
         otz = otz or 'local'
+        epoch, frac = divmod(self.ns, 1000000000)
         if otz == 'local':
-            tm = time.localtime(self.moment)
+            tm = time.localtime(epoch)
         elif otz.lower() == 'utc':
-            tzset('UTC+00UTC+00')
-            tm = time.gmtime(self.moment)
+            tm = time.gmtime(epoch)
+        elif zoned:
+            tm = self.localtime(otz)
         else:
-            offset = duration(seconds=utc_offset(self.moment, otz))
-            tm = time.gmtime(self.moment + offset.seconds)
-            fmt = fmt.replace('%Z', tzname(tz=otz, epoch=self.moment))
-            fmt = fmt.replace('%z', offset("%H%M"))
-        rval = time.strftime(fmt, tm)
-        tzset(None)
-        return rval
+            tm = time.gmtime(epoch + _zone_info(epoch, otz)[0])
+        if subsec:
+            return time.strftime(fmt, tm).format(frac // 1000, frac)
+        return time.strftime(fmt, tm)
+
+    # -------------------------------------------------------------------------
+    @property
+    def moment(self):
+        """
+        The stored moment as a UTC epoch in whole seconds, rounded down (class
+        moment)
+        """
+        return self.ns // 1000000000
+
+    # -------------------------------------------------------------------------
+    @moment.setter
+    def moment(self, value):
+        """
+        Sets the stored moment to the UTC epoch *value*, which may have a
+        fraction (class moment)
+        """
+        self.ns = _ns(value)
 
     # -------------------------------------------------------------------------
     def __add__(self, other):
@@ -702,11 +1036,13 @@ class moment(object):
         (class moment)
         """
         if isinstance(other, duration):
-            rval = moment(self.epoch() + other.seconds)
+            rval = moment.from_ns(self.ns + other.ns)
         elif isinstance(other, numbers.Number):
-            rval = moment(self.epoch() + other)
+            rval = moment.from_ns(self.ns + _ns(other))
         elif isinstance(other, moment):
             raise TypeError(txt['mom-sum'])
+        elif _defers(other):
+            rval = NotImplemented
         else:
             raise TypeError(txt['optypes-02'].format(type(self), type(other)))
         return rval
@@ -738,27 +1074,73 @@ class moment(object):
             True
         (class moment)
         """
-        if isinstance(other, moment):
-            rval = (self.epoch() == other.epoch())
-        elif isinstance(other, numbers.Number):
-            rval = (self.epoch() == int(other))
+        if type(other) is moment:
+            return self.ns == other.ns
+        if isinstance(other, (moment, numbers.Number)):
+            rval = self._order(other, operator.eq)
         elif isinstance(other, str):
             if other.isdigit():
-                rval = (self.epoch() == int(other))
+                rval = (self.ns == _ns(int(other)))
             else:
-                othm = moment(other)
-                rval = (self.epoch() == othm.epoch())
+                rval = (self.ns == moment(other).ns)
         elif isinstance(other, time.struct_time):
-            othm = moment(other)
-            rval = (self.epoch() == othm.epoch())
+            rval = (self.ns == moment(other).ns)
         elif isinstance(other, tuple):
             if 6 <= len(other) <= 9:
-                othm = moment(other)
-                rval = (self.epoch() == othm.epoch())
+                rval = (self.ns == moment(other).ns)
             else:
                 raise ValueError(txt['tuplen'])
+        else:
+            rval = NotImplemented
         return rval
 
+    # -------------------------------------------------------------------------
+    def __ge__(self, other):
+        """
+        Is *self* at or after *other*? (class moment)
+        """
+        if type(other) is moment:
+            return self.ns >= other.ns
+        return self._order(other, operator.ge)
+
+    # -------------------------------------------------------------------------
+    def __gt__(self, other):
+        """
+        Is *self* after *other*? (class moment)
+        """
+        if type(other) is moment:
+            return self.ns > other.ns
+        return self._order(other, operator.gt)
+
+    # -------------------------------------------------------------------------
+    def __hash__(self):
+        """
+        Hash like the epoch number the moment equals: the int epoch on a
+        whole second, otherwise the nearest float. At the size of real epochs,
+        floats are further apart than a nanosecond, so a moment and the float
+        it equals find the same dict key. (class moment)
+        """
+        epoch, frac = divmod(self.ns, 1000000000)
+        return hash(self.ns / 1000000000) if frac else hash(epoch)
+
+    # -------------------------------------------------------------------------
+    def __le__(self, other):
+        """
+        Is *self* at or before *other*? (class moment)
+        """
+        if type(other) is moment:
+            return self.ns <= other.ns
+        return self._order(other, operator.le)
+
+    # -------------------------------------------------------------------------
+    def __lt__(self, other):
+        """
+        Is *self* before *other*? (class moment)
+        """
+        if type(other) is moment:
+            return self.ns < other.ns
+        return self._order(other, operator.lt)
+
     # -------------------------------------------------------------------------
     def __sub__(self, other):
         """
@@ -771,15 +1153,25 @@ class moment(object):
         (class moment)
         """
         if isinstance(other, moment):
-            rval = duration(seconds=(self.epoch() - other.epoch()))
+            rval = duration._from_ns(self.ns - other.ns)
         elif isinstance(other, numbers.Number):
-            rval = moment(self.epoch() - other)
+            rval = moment.from_ns(self.ns - _ns(other))
         elif isinstance(other, duration):
-            rval = moment(self.epoch() - other.seconds)
+            rval = moment.from_ns(self.ns - other.ns)
+        elif _defers(other):
+            rval = NotImplemented
         else:
             raise ValueError(txt['inv-subtrahend'])
         return rval
 
+    # -------------------------------------------------------------------------
+    def __reduce__(self):
+        """
+        Pickles a moment as its class and nanosecond count, like
+        duration.__reduce__() (class moment)
+        """
+        return (copyreg.__newobj__, (type(self),), self.ns)
+
     # -------------------------------------------------------------------------
     def __repr__(self):
         """
@@ -794,9 +1186,19 @@ class moment(object):
             nldt.moment(1481000400)
         (class moment)
         """
-        rval = "nldt.moment({:d})".format(int(self.moment))
+        if self.ns % 1000000000:
+            return "nldt.moment.from_ns({:d})".format(self.ns)
+        rval = "nldt.moment({:d})".format(self.moment)
         return rval
 
+    # -------------------------------------------------------------------------
+    def __setstate__(self, count):
+        """
+        Unpickles a moment from the nanosecond *count* __reduce__() saved
+        (class moment)
+        """
+        self.ns = count
+
     # -------------------------------------------------------------------------
     def __str__(self):
         """
@@ -811,25 +1213,134 @@ class moment(object):
         """
         return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self.moment))
 
+    # -------------------------------------------------------------------------
+    @classmethod
+    def _from_epoch(cls, epoch):
+        """
+        Returns a moment at the int *epoch* without going through __init__.
+        For internal arithmetic, where *epoch* is already known to be a UTC
+        epoch. (class moment)
+        """
+        rval = object.__new__(cls)
+        rval.ns = epoch * 1000000000
+        return rval
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def _formatter(cls, fmt):
+        """
+        Returns (strftime format, zoned, subsec) for *fmt*. %F and %T are
+        spelled out in the format, since not every C library knows them, and
+        *zoned* is True if the format has %Z or %z, which need the zone name
+        and offset in the broken-down time. If the format has %f or %N,
+        *subsec* is True and the strftime format is also a str.format()
+        pattern taking the microseconds and the nanoseconds. The result for
+        each *fmt* is kept in moment.formatters (up to moment.formatter_size
+        of them). (class moment)
+        """
+        rval = cls.formatters.get(fmt)
+        if rval is not None:
+            return rval
+        specs = _STRFTIME.findall(fmt)
+        subsec = '%f' in specs or '%N' in specs
+        if subsec:
+            specs = [_STRFTIME_SUBSEC.get(spec) or
+                     spec.replace('{', '{{').replace('}', '}}')
+                     for spec in specs]
+        rval = (''.join(_STRFTIME_SPELLED.get(spec, spec) for spec in specs),
+                '%Z' in specs or '%z' in specs, subsec)
+        with cls.lock:
+            cls.formatters[fmt] = rval
+            while cls.formatter_size < len(cls.formatters):
+                del cls.formatters[next(iter(cls.formatters))]
+        return rval
+
     # -------------------------------------------------------------------------
     def _guess_format(self, spec):
         """
-        Tries each of the parse formats in the list until one works or the list
-        is exhausted. Returns the UTC epoch (or None if we don't find a
-        matching format). (class moment)
+        Tries the format learned for the shape of *spec*, then the formats
+        that have the same shape and, if none of them works, the rest of
+        moment.formats in order. Returns the UTC epoch or raises ValueError if
+        no format matches. Strings in moment.rejects fail at once, as long as
+        moment.formats has not changed since they were added. (class moment)
         """
-        tm = None
-        for fmt in self.formats:
+        cls = moment
+        if spec in cls.rejects and cls.reject_formats == self.formats:
+            with cls.lock:
+                cls.reject_counts['rejected'] += 1
+            raise ValueError(txt['no-match'])
+
+        if cls.shape_formats != self.formats:
+            cls._shape_table(self.formats)
+        shape = _shape(spec)
+        known = cls.learned.get(shape)
+        if known is not None:
+            if _local.tally is not None:
+                _local.tally['strptime'] += 1
             try:
-                tm = time.strptime(spec, fmt)
-                break
+                return timegm(time.strptime(spec, known))
             except ValueError:
                 pass
 
-        if tm:
-            return timegm(tm)
-        else:
-            raise ValueError(txt['no-match'])
+        shapes = cls.shapes
+        for fmts in shapes.get(shape, shapes[None]):
+            for fmt in fmts:
+                if fmt == known:
+                    continue
+                if _local.tally is not None:
+                    _local.tally['strptime'] += 1
+                try:
+                    tm = time.strptime(spec, fmt)
+                except ValueError:
+                    continue
+                cls._learn(shape, fmt)
+                return timegm(tm)
+
+        with cls.lock:
+            cls.reject_counts['failed'] += 1
+            if cls.reject_formats != self.formats:
+                cls.rejects.clear()
+                cls.reject_formats = list(self.formats)
+            if cls.reject_size:
+                cls.rejects[spec] = True
+                if cls.reject_size < len(cls.rejects):
+                    cls.rejects.popitem(last=False)
+        raise ValueError(txt['no-match'])
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def _learn(cls, shape, fmt):
+        """
+        Remembers *fmt* as the format for *shape* if _learnable() allows it.
+        When moment.learned_size shapes are known, the one learned first is
+        forgotten. (class moment)
+        """
+        if not cls.learned_size or not cls._learnable(shape, fmt):
+            return
+        with cls.lock:
+            cls.learned.pop(shape, None)
+            cls.learned[shape] = fmt
+            while cls.learned_size < len(cls.learned):
+                del cls.learned[next(iter(cls.learned))]
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def _learnable(cls, shape, fmt):
+        """
+        Returns True if trying *fmt* first for strings of *shape* gives the
+        same results as trying the formats in order. That holds when every
+        format ahead of *fmt* in the order for *shape* differs from it only in
+        %b against %B, since any string that both accept names the same month
+        either way. A shape like '9.9 9' (for '%Y.%m%d' and '%Y.%m%d %H') is
+        never learned beyond its first format. (class moment)
+        """
+        first, rest = cls.shapes.get(shape, cls.shapes[None])
+        order = first + rest
+        if fmt not in order:
+            return False
+        bare = fmt.replace('%B', '%b')
+        return all(x.replace('%B', '%b') == bare
+                   for x in order[:order.index(fmt)])
 
     # -------------------------------------------------------------------------
     def _normalize(self, when, tz):
@@ -841,17 +1352,66 @@ class moment(object):
         return when - offset
 
     # -------------------------------------------------------------------------
-    def _validate(self, unit, start):
+    def _order(self, other, op):
         """
-        If *unit* is not 'week' and *start* is not None, raise an exception. If
-        start is not a weekday, raise an exception (class moment)
+        Applies comparison *op* to *self* and *other*, a moment (or a
+        subclass) or a UTC epoch, on the nanosecond counts. Infinities and
+        NaN have no count and are compared as they are. Anything else is
+        NotImplemented. (class moment)
         """
-        wk = week()
-        if start:
-            if unit != 'week':
-                raise ValueError(txt['start-inv01'])
-            elif all([start not in x for x in wk.day_list()]):
-                raise ValueError(txt['start-inv02'])
+        if isinstance(other, moment):
+            return op(self.ns, other.ns)
+        elif isinstance(other, int) or isinstance(other, numbers.Real) and \
+                math.isfinite(other):
+            return op(self.ns, _ns(other))
+        elif isinstance(other, numbers.Number):
+            return op(self.ns, other)
+        return NotImplemented
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def _shape_table(cls, formats):
+        """
+        Sorts *formats* by shape for _guess_format(). Each shape maps to a
+        pair of lists: the formats that can match a string of that shape and
+        then all the others, each in their original order without repeats.
+
+        strptime lets %d match a blank and a digit (' 7'), so a format where
+        %d does not follow white space is also filed under the shape with a
+        blank there ('%Y.%m%d' matches '1986.11 7'). Formats using directives
+        other than the ones in moment.formats can't be given a shape and go at
+        the front of every first list. (class moment)
+        """
+        fixed = {'%Y': '0', '%y': '0', '%m': '0', '%d': '0', '%H': '0',
+                 '%M': '0', '%S': '0', '%b': 'x', '%B': 'x'}
+        order = []
+        byshape = collections.OrderedDict()
+        for fmt in formats:
+            if fmt in order:
+                continue
+            order.append(fmt)
+            parts = re.split("(%.)", fmt)
+            if any(x not in fixed for x in parts[1::2]):
+                byshape.setdefault(None, []).append(fmt)
+                continue
+            choices = [[fixed.get(x, x)] for x in parts]
+            for idx in range(1, len(parts), 2):
+                before = "".join(parts[:idx])[-1:]
+                if parts[idx] == '%d' and not before.isspace():
+                    choices[idx].append(' 0')
+            for bare in itertools.product(*choices):
+                byshape.setdefault(_shape("".join(bare)), []).append(fmt)
+
+        wild = byshape.pop(None, [])
+        rval = {None: (wild, [x for x in order if x not in wild])}
+        for key, fmts in byshape.items():
+            first = [x for x in order if x in wild or x in fmts]
+            rval[key] = (first, [x for x in order if x not in first])
+        with cls.lock:
+            cls.shapes = rval
+            cls.shape_formats = list(formats)
+            cls.learned = {shape: fmt for shape, fmt in cls.learned.items()
+                           if cls._learnable(shape, fmt)}
 
     # -------------------------------------------------------------------------
     def asctime(self, tz=None):
@@ -882,7 +1442,15 @@ class moment(object):
 
         (class moment)
         """
-        return int(self.moment)
+        return self.ns // 1000000000
+
+    # -------------------------------------------------------------------------
+    def epoch_ns(self):
+        """
+        Returns the currently stored moment as an int count of nanoseconds
+        since the epoch (class moment)
+        """
+        return self.ns
 
     # -------------------------------------------------------------------------
     def gmtime(self):
@@ -912,98 +1480,43 @@ class moment(object):
             time.struct_time(tm_year=2016, tm_mon=12, tm_mday=4, tm_hour=7,
             tm_min=37, tm_sec=12, tm_wday=6, tm_yday=339, tm_isdst=0)
 
-        (class moment)
+        The struct is built from the pytz zone rather than by pointing
+        os.environ['TZ'] at *tz*, so calls from several threads do not disturb
+        each other. (class moment)
         """
-        with tz_context(tz):
-            rval = time.localtime(self.moment)
-        return rval
+        if tz is None:
+            return time.localtime(self.moment)
+        offset, isdst, name = _zone_info(self.moment, tz)
+        return time.struct_time(time.gmtime(self.moment + offset)[:8] +
+                                (isdst, name, offset))
 
     # -------------------------------------------------------------------------
     def ceiling(self, unit, start=None):
         """
         Computes the ceiling of *unit* (second, minute, hour, day, etc.) from
-        *self*.epoch()
+        *self*.epoch(). For unit 'week', *start* names the weekday weeks begin
+        on (default monday).
 
         (class moment)
         """
-        wk = week()
-        self._validate(unit, start)
-        tm = time.gmtime(self.epoch())
+        first = _week_first(unit, start)
+        epoch = self.ns // 1000000000
         if unit == 'second':
-            ceil = self.epoch()
-        elif unit == 'minute':
-            ceil = timegm((tm.tm_year, tm.tm_mon, tm.tm_mday,
-                           tm.tm_hour, tm.tm_min, 59, 0, 0, 0))
-        elif unit == 'hour':
-            ceil = timegm((tm.tm_year, tm.tm_mon, tm.tm_mday,
-                           tm.tm_hour, 59, 59, 0, 0, 0))
-        elif unit == 'day':
-            ceil = timegm((tm.tm_year, tm.tm_mon, tm.tm_mday,
-                           23, 59, 59, 0, 0, 0))
-        elif unit == 'week':
-            start = start or 'monday'
-            delta = (6 + wk.index(start) - tm.tm_wday) % 7
-            ceil = timegm((tm.tm_year, tm.tm_mon, tm.tm_mday + delta,
-                           23, 59, 59, 0, 0, 0))
-        elif unit == 'month':
-            maxday = month().days(year=tm.tm_year, month=tm.tm_mon)
-            ceil = timegm((tm.tm_year, tm.tm_mon, maxday,
-                           23, 59, 59, 0, 0, 0))
-        elif unit == 'year':
-            ceil = timegm((tm.tm_year, 12, 31, 23, 59, 59, 0, 0, 0))
-        else:
-            raise ValueError(txt['not-timeu'].format(unit))
-        return moment(ceil)
+            return moment._from_epoch(epoch)
+        return moment._from_epoch(_floor_epoch(epoch, unit, 1, first) - 1)
 
     # -------------------------------------------------------------------------
     def floor(self, unit, start=None):
         """
         Computes the floor of *unit* (second, minute, hour, day, etc.) from
-        *self*.epoch()
+        *self*.epoch(). For unit 'week', *start* names the weekday weeks begin
+        on (default monday).
 
         (class moment)
         """
-        wk = week()
-        self._validate(unit, start)
-        epoch = self.epoch()
-        if unit == 'second':
-            rval = self
-        elif unit == 'minute':
-            tm = time.gmtime(epoch)
-            floor = timegm((tm.tm_year, tm.tm_mon, tm.tm_mday,
-                            tm.tm_hour, tm.tm_min, 0, 0, 0, 0))
-            rval = moment(floor)
-        elif unit == 'hour':
-            tm = time.gmtime(epoch)
-            floor = timegm((tm.tm_year, tm.tm_mon, tm.tm_mday, tm.tm_hour,
-                            0, 0, 0, 0, 0))
-            rval = moment(floor)
-        elif unit == 'day':
-            tm = time.gmtime(epoch)
-            floor = timegm((tm.tm_year, tm.tm_mon, tm.tm_mday, 0, 0, 0,
-                            0, 0, 0))
-            rval = moment(floor)
-        elif unit == 'week':
-            start = start or 'monday'
-            tm = time.gmtime(epoch)
-            # tm = time.localtime(epoch)
-            delta = (7 + tm.tm_wday - wk.index(start)) % 7
-            floor = timegm((tm.tm_year, tm.tm_mon, tm.tm_mday - delta,
-                            0, 0, 0, 0, 0, 0))
-            # floor = time.mktime((tm.tm_year, tm.tm_mon, tm.tm_mday - delta,
-            #                      0, 0, 0, 0, 0, 0))
-            rval = moment(floor)
-        elif unit == 'month':
-            tm = time.gmtime(epoch)
-            nflr = timegm((tm.tm_year, tm.tm_mon, 1, 0, 0, 0, 0, 0, 0))
-            rval = moment(nflr)
-        elif unit == 'year':
-            tm = time.gmtime(epoch)
-            nflr = timegm((tm.tm_year, 1, 1, 0, 0, 0, 0, 0, 0))
-            rval = moment(nflr)
-        else:
-            raise ValueError(txt['not-timeu'].format(unit))
-        return rval
+        first = _week_first(unit, start)
+        return moment._from_epoch(_floor_epoch(self.ns // 1000000000, unit, 0,
+                                               first))
 
     # -------------------------------------------------------------------------
     def time(self):
@@ -1030,21 +1543,11 @@ class month(Indexable):
     # -------------------------------------------------------------------------
     def __init__(self):
         """
-        Set up month info (class month)
+        Set up month info. The table is shared with every other month object
+        (see lexicon()). (class month)
         """
-        self._dict = {}
-        for midx in range(1, 13):
-            date = "2010.{:02d}01".format(midx)
-            q = moment(date, itz='utc')
-            mname = q('%B', otz='utc').lower()
-            abbr = mname[0:3]
-            this = {'name': mname,
-                    'abbr': abbr,
-                    'idx': midx,
-                    'days': self._days(midx)
-                    }
-            self._dict[abbr] = this
-            self._dict[midx] = this
+        self._dict = lexicon()['month']
+        self._alias = lexicon()['month_alias']
 
     # -------------------------------------------------------------------------
     def days(self, month, year=None):
@@ -1062,13 +1565,9 @@ class month(Indexable):
     def _days(self, midx):
         """
         This is a private function returning the number of days in each month,
-        based on the year 2010. It is used for setting up self._dict. (class
-        month)
+        based on the year 2010. (class month)
         """
-        q = moment("2010.{:02d}01".format((midx % 12) + 1))
-        p = moment(q.moment - 24 * 3600)
-        rval = int(p('%d'))
-        return rval
+        return self._dict[midx]['days']
 
     # -------------------------------------------------------------------------
     def index(self, name_or_idx):
@@ -1130,17 +1629,56 @@ class Parser(object):
     The start moment will come in as a UTC time because moments always
     represent UTC. So it will have to be converted to local time to know where
     we're starting from.
+
+    The rule table is built once for the class. The word lists come from the
+    shared lexicon, so constructing a Parser does no date arithmetic.
+
+    Each expression is split into tokens once by tokenize(). Dispatch and all
+    the plan_* methods work from the token list rather than rescanning the
+    text.
+
+    With instrumentation on, each call records the time spent in each of
+    the stages and the counts listed in Parser.counts (see stats()).
+
+    One Parser may be shared by several threads. Parsing never sets
+    os.environ['TZ'] or calls time.tzset(); the caches and totals are guarded
+    by self.lock and the record of an instrumented call is kept per thread.
     """
+    yestermorrow = frozenset(['yesterday', 'today', 'now', 'tomorrow'])
+    rules = ['of_in', 'ago', 'from_now', 'month', 'week', 'year', 'weekday']
+    rank = {name: idx for idx, name in enumerate(rules)}
+    stages = ['tokenize', 'dispatch', 'plan', 'evaluate', 'total']
+    counts = ['strptime', 'tzset', 'utc_offset', 'recursion']
+
     # -------------------------------------------------------------------------
-    def __init__(self):
+    def __init__(self, cache_size=None, instrument=None, reject_size=1024):
         """
-        Sets up the Parser object (class Parser)
+        Sets up the Parser object. If *cache_size* is a positive number,
+        results are kept in a least-recently-used cache holding at most that
+        many entries. If *instrument* is True, each call is timed and counted
+        and the totals are available from stats(). If *instrument* is a
+        callable, it is also called with the record of each call. Up to
+        *reject_size* expressions that could not be resolved are remembered
+        so they can be turned away at once if they come back (see
+        reject_info()). (class Parser)
         """
         self.preps = prepositions()
         self.tu = time_units()
         self.wk = week()
         self.mon = month()
-        self.wkday_rgx = self.wk.match_weekdays()
+        self.mon_names = lexicon()['mon_names']
+        self.cache_size = cache_size or 0
+        self.cache = collections.OrderedDict()
+        self.plans = collections.OrderedDict()
+        self.cache_tz = None
+        self.hits = self.misses = 0
+        self.reject_size = reject_size or 0
+        self.rejects = collections.OrderedDict()
+        self.rejected = self.failed = 0
+        self.instrument = instrument
+        self.local = _Local()
+        self.lock = threading.Lock()
+        self.stats_clear()
 
     # -------------------------------------------------------------------------
     def __call__(self, expr, start=None):
@@ -1148,49 +1686,218 @@ class Parser(object):
         Parses *expr*, using *start* as the initial reference point if
         provided. (class Parser)
         """
+        if self.instrument:
+            return self.instrumented(expr, start)
+        return self.resolve(expr, start)
+
+    # -------------------------------------------------------------------------
+    def cache_clear(self):
+        """
+        Empties the result cache and the rejects and resets their counters
+        (class Parser)
+        """
+        with self.lock:
+            self.cache.clear()
+            self.plans.clear()
+            self.rejects.clear()
+            self.hits = self.misses = 0
+            self.rejected = self.failed = 0
+
+    # -------------------------------------------------------------------------
+    def cache_info(self):
+        """
+        Returns a dict reporting result cache hits, misses, current size, and
+        maximum size (class Parser)
+        """
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'size': len(self.cache),
+                    'maxsize': self.cache_size}
+
+    # -------------------------------------------------------------------------
+    def compile(self, expr):
+        """
+        Reduces *expr* to a Plan, a picklable list of steps that can be applied
+        to any number of anchors without looking at the text again. Nested
+        expressions ('end of next week', 'week after next') are flattened into
+        a single list and adjacent steps are merged where possible. When the
+        cache is enabled, plans are kept alongside results.
+
+        An expression that fails is added to self.rejects. Compiling it again
+        raises the same error without tokenizing or dispatching. (class
+        Parser)
+        """
         expr = expr.replace("earlier", "ago")
         expr = expr.replace("later", "from now")
+        record = self.local.record
+        if self.cache_size:
+            with self.lock:
+                rval = self.plans.get(expr)
+                if rval is not None:
+                    self.plans.move_to_end(expr)
+            if rval is not None:
+                if record is not None:
+                    record['cached'] = True
+                    record['rule'] = rval.rule
+                return rval
+
+        failure = self.rejects.get(expr)
+        if failure is not None:
+            with self.lock:
+                self.rejected += 1
+                if expr in self.rejects:
+                    self.rejects.move_to_end(expr)
+            if record is not None:
+                record['cached'] = True
+                record['rule'] = failure[2]
+            raise failure[0](*failure[1])
+
+        rule, stage, nested = None, 'tokenize', 0.0
+        since = None if record is None else time.perf_counter()
+        try:
+            tokens = tokenize(expr)
+            if record is not None:
+                since, stage = self.lap(record, stage, since), 'dispatch'
+            rule, found = self.dispatch(expr, tokens)
+            if record is not None:
+                since, stage = self.lap(record, stage, since), 'plan'
+                nested = record['time']['dispatch']
+            rval = Plan(expr, self.plan(expr, tokens, (rule, found)), rule)
+        except (ParseError, ValueError) as err:
+            with self.lock:
+                self.failed += 1
+                if self.reject_size:
+                    self.rejects[expr] = (type(err), err.args, rule)
+                    if self.reject_size < len(self.rejects):
+                        self.rejects.popitem(last=False)
+            raise
+        finally:
+            if record is not None:
+                record['rule'] = rule
+                if stage == 'plan':
+                    # nested dispatches were already timed by plan()
+                    record['time']['plan'] -= (record['time']['dispatch'] -
+                                               nested)
+                self.lap(record, stage, since)
+        if self.cache_size:
+            with self.lock:
+                self.plans[expr] = rval
+                if self.cache_size < len(self.plans):
+                    self.plans.popitem(last=False)
+        return rval
 
-        result = []
-        start = start or moment()
-        if self.research(r"\s(of|in)\s", expr, result):
-            rval = self.parse_of_in(expr, result[0].group(), start)
-        elif expr.strip().lower() in self.mon.names():
-            rval = self.parse_mon_name(expr, start)
-        elif expr in ['yesterday', 'today', 'now', 'tomorrow']:
-            rval = self.parse_yestermorrow(expr, start)
-        elif 'ago' in expr:
-            rval = self.parse_ago(expr, start)
-        elif 'from now' in expr:
-            rval = self.parse_from_now(expr, start)
-        elif self.research(r"(\s|^)month(\s|$)", expr, result):
-            rval = self.parse_month(expr, start)
-        elif self.research(r"(\s|^)week(\s|$)", expr, result):
-            rval = self.parse_week(expr, start)
-        elif self.research(r"(\s|^)year(\s|$)", expr, result):
-            rval = self.parse_year(expr, start)
-        elif self.research(self.wkday_rgx, expr, result):
-            rval = self.parse_weekday(expr, result, start)
-        else:
-            raise ParseError(txt['parse-fail'].format(expr))
+    # -------------------------------------------------------------------------
+    def dispatch(self, expr, tokens=None):
+        """
+        Decides which rule handles *expr* and returns the tuple (rule, token),
+        where token is the first Token carrying the rule's keyword (None for
+        the whole-expression rules). If no rule applies, (None, None) is
+        returned. Whole-expression words ('may', 'tomorrow') are found by set
+        lookup. Otherwise, the highest ranked rule among the keywords in
+        *tokens* (default: tokenize(expr)) wins. (class Parser)
+        """
+        if expr in self.yestermorrow:
+            return 'yestermorrow', None
+        elif expr.strip().lower() in self.mon_names:
+            return 'mon_name', None
+
+        if tokens is None:
+            tokens = tokenize(expr)
+        rule, found = None, None
+        for tok in tokens:
+            if tok.text in ['of', 'in'] and 0 < tok.pos < len(tokens) - 1:
+                name = 'of_in'
+            elif tok.text == 'ago':
+                name = 'ago'
+            elif (tok.text == 'from' and tok.pos < len(tokens) - 1 and
+                  tokens[tok.pos + 1].text == 'now'):
+                name = 'from_now'
+            elif tok.text in ['month', 'week', 'year']:
+                name = tok.text
+            elif tok.kind == 'weekday':
+                name = 'weekday'
+            else:
+                continue
+            if rule is None or self.rank[name] < self.rank[rule]:
+                rule, found = name, tok
+                if self.rank[rule] == 0:
+                    break
+        return rule, found
+
+    # -------------------------------------------------------------------------
+    def evaluate(self, plan, start):
+        """
+        Runs *plan* from *start*, timing it if a call is being recorded
+        (class Parser)
+        """
+        record = self.local.record
+        if record is None:
+            return plan(start)
+        began = time.perf_counter()
+        rval = plan(start)
+        record['time']['evaluate'] += time.perf_counter() - began
         return rval
 
+    # -------------------------------------------------------------------------
+    def instrumented(self, expr, start):
+        """
+        Parses *expr* like __call__() while recording the rule that fired, the
+        time spent in each stage, and the number of strptime attempts, tzset
+        calls, utc_offset lookups, and nested rule applications. The record is
+        added to the totals reported by stats() and, if self.instrument is
+        callable, passed to it. (class Parser)
+        """
+        outer = _local.tally
+        rec = {'expr': expr, 'rule': None, 'cached': False,
+               'time': dict.fromkeys(self.stages, 0.0)}
+        rec.update(dict.fromkeys(self.counts, 0))
+        self.local.record = _local.tally = rec
+        began = time.perf_counter()
+        try:
+            return self.resolve(expr, start)
+        finally:
+            rec['time']['total'] = time.perf_counter() - began
+            self.local.record = None
+            _local.tally = outer
+            if outer is not None:
+                for name in ['strptime', 'tzset', 'utc_offset']:
+                    outer[name] += rec[name]
+            with self.lock:
+                self.tally(rec)
+            if callable(self.instrument):
+                self.instrument(rec)
+
+    # -------------------------------------------------------------------------
+    def parse_many(self, exprs, start=None, epochs=False):
+        """
+        Resolves each expression in *exprs* against the single reference point
+        *start* (default: now) and returns the results in input order. The
+        reference point is broken down once for the whole batch and each
+        distinct expression is only resolved once. If *epochs* is True, the
+        result is an array.array('q') of epochs rather than a list of moments.
+        (class Parser)
+        """
+        exprs = list(exprs)
+        start = start or moment()
+        memo = {}
+        resolved = {}
+        for expr in exprs:
+            if expr not in resolved:
+                resolved[expr] = self.compile(expr)(start, memo)
+        if epochs:
+            return array.array('q', [resolved[x].epoch() for x in exprs])
+        return [resolved[x] for x in exprs]
+
     # -------------------------------------------------------------------------
     def parse_of_in(self, expr, prep, start):
         """
         Handles expressions like 'third of May', 'first week in June' (class
         Parser)
         """
-        unit = self.tu.find_unit(expr)
-        pre, post = expr.split(prep)
-        rval = self(post)
-        if pre == 'end' and unit:
-            rval = rval.ceiling(unit)
-        elif pre == 'beginning':
-            pass
-        else:
-            rval = self(pre, rval)
-        return rval
+        tokens = tokenize(expr)
+        found = [tok for tok in tokens if tok.text == prep.strip()]
+        return Plan(expr, self.plan_of_in(tokens, found[0]))(start)
 
     # -------------------------------------------------------------------------
     def parse_mon_name(self, expr, start):
@@ -1198,10 +1905,7 @@ class Parser(object):
         Handles expressions like 'May', 'October', 'February, 1933' (class
         Parser)
         """
-        rval = moment()
-        tm = rval.gmtime()
-        midx = self.mon.index(expr)
-        return moment((tm.tm_year, midx, 1, 0, 0, 0, 0, 0, 0))
+        return Plan(expr, self.plan_mon_name(tokenize(expr)))(start)
 
     # -------------------------------------------------------------------------
     def parse_ago(self, expr, start):
@@ -1209,17 +1913,7 @@ class Parser(object):
         Handle expressions like 'a week ago', 'three days ago', 'five years
         ago', etc. (class Parser)
         """
-        nums = numberize.scan(expr)
-        if isinstance(nums[0], int):
-            count = nums[0]
-        else:
-            count = 1
-        unit = self.tu.find_unit(expr)
-        if unit is None:
-            raise ValueError(txt['no-unit'].format(expr))
-        rval = moment()
-        rval = moment(rval.epoch() - count * self.tu.magnitude(unit))
-        return rval
+        return Plan(expr, self.plan_ago(tokenize(expr)))(start)
 
     # -------------------------------------------------------------------------
     def parse_from_now(self, expr, start):
@@ -1227,114 +1921,360 @@ class Parser(object):
         Handle expressions like 'an hour from now', 'two days from now', 'four
         weeks from now', 'three years from now', etc. (class Parser)
         """
-        nums = numberize.scan(expr)
-        if isinstance(nums[0], int):
-            count = nums[0]
-        else:
-            count = 1
-        unit = self.tu.find_unit(expr)
-        if unit is None:
-            raise ValueError(txt['no-unit'].format(expr))
-        rval = moment()
-        rval = moment(rval.epoch() + count * self.tu.magnitude(unit))
-        return rval
+        return Plan(expr, self.plan_from_now(tokenize(expr)))(start)
 
     # -------------------------------------------------------------------------
     def parse_month(self, expr, start):
         """
         Handle 'next month', 'last month' (class Parser)
         """
-        wb = word_before('month', expr)
-        if wb == 'last':
-            day_mag = self.tu.magnitude('day')
-            floor = start.floor('month').epoch()
-            rval = moment(floor - day_mag).floor('month')
-        elif wb == 'next':
-            week_mag = self.tu.magnitude('week')
-            ceil = start.ceiling('month').epoch()
-            rval = moment(ceil + week_mag).floor('month')
-        return rval
+        tokens = tokenize(expr)
+        return Plan(expr, self.plan_month(tokens, self.keyword(
+            tokens, 'month')))(start)
 
     # -------------------------------------------------------------------------
     def parse_week(self, expr, start):
         """
         Various expressions that involve 'week' (class Parser)
         """
-        wb = word_before('week', expr)
+        tokens = tokenize(expr)
+        return Plan(expr, self.plan_week(tokens, self.keyword(
+            tokens, 'week')))(start)
+
+    # -------------------------------------------------------------------------
+    def parse_year(self, expr, start):
+        """
+        Parse expressions like 'last year', 'next year' (class Parser)
+        """
+        tokens = tokenize(expr)
+        return Plan(expr, self.plan_year(tokens, self.keyword(
+            tokens, 'year')))(start)
+
+    # -------------------------------------------------------------------------
+    def parse_weekday(self, expr, result, start):
+        """
+        Parse expressions like 'next monday', 'last wednesday', etc. *result*
+        is a list whose first item is a regex match for the weekday name.
+        (class Parser)
+        """
+        tokens = tokenize(expr)
+        return Plan(expr, self.plan_weekday(tokens, self.keyword(
+            tokens, result[0].group().lower())))(start)
+
+    # -------------------------------------------------------------------------
+    def parse_yestermorrow(self, expr, start):
+        """
+        Handle 'yesterday', 'today', 'tomorrow'. Decided that 'today' should
+        return the same as 'now' and that 'yesterday' and 'tomorrow' are offset
+        from now by a day's magnitude in opposite directions. The other option
+        would be to have each of these resolve to the floor of a day. If floor
+        is what is desired, we can always do m = <parser>('today').floor().
+        (class Parser)
+        """
+        return Plan(expr, self.plan_yestermorrow(tokenize(expr)))(start)
+
+    # -------------------------------------------------------------------------
+    def plan(self, expr, tokens, match=None):
+        """
+        Returns the list of steps for *expr*, which has already been split
+        into *tokens*. *match* is the (rule, token) pair from dispatch() when
+        the caller has already dispatched *expr*. Without it, *expr* is part
+        of a larger expression and is dispatched (and counted as a recursion)
+        here. (class Parser)
+        """
+        record = self.local.record
+        if match is not None:
+            rule, found = match
+        elif record is None:
+            rule, found = self.dispatch(expr, tokens)
+        else:
+            began = time.perf_counter()
+            rule, found = self.dispatch(expr, tokens)
+            record['time']['dispatch'] += time.perf_counter() - began
+            record['recursion'] += 1
+        if rule == 'of_in':
+            rval = self.plan_of_in(tokens, found)
+        elif rule == 'mon_name':
+            rval = self.plan_mon_name(tokens)
+        elif rule == 'yestermorrow':
+            rval = self.plan_yestermorrow(tokens)
+        elif rule == 'ago':
+            rval = self.plan_ago(tokens)
+        elif rule == 'from_now':
+            rval = self.plan_from_now(tokens)
+        elif rule == 'month':
+            rval = self.plan_month(tokens, found)
+        elif rule == 'week':
+            rval = self.plan_week(tokens, found)
+        elif rule == 'year':
+            rval = self.plan_year(tokens, found)
+        elif rule == 'weekday':
+            rval = self.plan_weekday(tokens, found)
+        else:
+            raise ParseError(txt['parse-fail'].format(expr))
+        return rval
+
+    # -------------------------------------------------------------------------
+    def plan_of_in(self, tokens, prep):
+        """
+        Steps for 'end of next month', 'first week in June': the steps for the
+        tokens after *prep*, then a ceiling ('end'), nothing ('beginning'), or
+        the steps for the tokens before *prep* (class Parser)
+        """
+        unit = self.tu.find_unit(tokens)
+        pre = subtokens(tokens, 0, prep.pos)
+        post = subtokens(tokens, prep.pos + 1)
+        rval = list(self.plan(detokenize(post), post))
+        words = [tok.text for tok in pre]
+        if words == ['end'] and unit:
+            rval.append(('ceiling', unit))
+        elif words == ['beginning']:
+            pass
+        else:
+            rval.extend(self.plan(detokenize(pre), pre))
+        return rval
+
+    # -------------------------------------------------------------------------
+    def plan_mon_name(self, tokens):
+        """
+        Steps for 'May', 'October': the first of the named month in the
+        anchor's year (class Parser)
+        """
+        return [('month_of', self.mon.index(detokenize(tokens)))]
+
+    # -------------------------------------------------------------------------
+    def plan_ago(self, tokens):
+        """
+        Steps for 'a week ago', 'three days ago' (class Parser)
+        """
+        return [('shift', -1 * self.count_units(tokens))]
+
+    # -------------------------------------------------------------------------
+    def plan_from_now(self, tokens):
+        """
+        Steps for 'an hour from now', 'two days from now' (class Parser)
+        """
+        return [('shift', self.count_units(tokens))]
+
+    # -------------------------------------------------------------------------
+    def plan_month(self, tokens, found):
+        """
+        Steps for 'next month', 'last month'. *found* is the 'month' token.
+        (class Parser)
+        """
+        wb = word_before(found, tokens)
+        if wb == 'last':
+            rval = [('floor', 'month', -1)]
+        elif wb == 'next':
+            rval = [('floor', 'month', 1)]
+        else:
+            raise ParseError(txt['parse-fail'].format(detokenize(tokens)))
+        return rval
+
+    # -------------------------------------------------------------------------
+    def plan_week(self, tokens, found):
+        """
+        Steps for the expressions that involve 'week'. *found* is the 'week'
+        token. (class Parser)
+        """
+        wb = word_before(found, tokens)
+        words = [tok.text for tok in tokens]
         if wb == 'last':
-            flr = start.week_floor().epoch()
-            rval = moment(flr - self.tu.magnitude('week'))
+            rval = [('floor', 'week', -1)]
         elif wb == 'next':
-            flr = start.week_floor().epoch()
-            rval = moment(flr + self.tu.magnitude('week'))
+            rval = [('floor', 'week', 1)]
         elif wb == 'first':
-            tm = start.gmtime()
-            delta = (7 - tm.tm_wday) % 7
-            rval = moment(timegm((tm.tm_year, tm.tm_mon, tm.tm_mday + delta,
-                                  0, 0, 0, 0, 0, 0)))
+            rval = [('floor', 'day', 0), ('on_or_after', 0)]
         elif wb == 'the' or wb == 'this':
-            rval = start.week_floor()
-        elif wb in self.wk.day_list():
-            start = self('next {}'.format(wb))
-            rval = self('next {}'.format(wb), start)
-        elif expr == 'week after next':
-            rval = self('next week')
-            rval = self('next week', rval)
-        elif expr == 'week before last':
-            rval = self('last week')
-            rval = self('last week', rval)
+            rval = [('floor', 'week', 0)]
+        elif wb and tokens[found.pos - 1].kind == 'weekday':
+            rval = 2 * [('next_wday', tokens[found.pos - 1].value)]
+        elif words == ['week', 'after', 'next']:
+            rval = 2 * [('floor', 'week', 1)]
+        elif words == ['week', 'before', 'last']:
+            rval = 2 * [('floor', 'week', -1)]
+        else:
+            raise ParseError(txt['parse-fail'].format(detokenize(tokens)))
         return rval
 
     # -------------------------------------------------------------------------
-    def parse_year(self, expr, start):
+    def plan_year(self, tokens, found):
         """
-        Parse expressions like 'last year', 'next year' (class Parser)
+        Steps for 'last year', 'next year'. *found* is the 'year' token.
+        (class Parser)
         """
-        wb = word_before('year', expr)
+        wb = word_before(found, tokens)
         if wb == 'last':
-            then = "{}-01-01".format(int(start("%Y")) - 1)
-            rval = moment(then)
+            rval = [('year', -1)]
         elif wb == 'next':
-            then = "{}-01-01".format(int(start("%Y")) + 1)
-            rval = moment(then)
+            rval = [('year', 1)]
+        else:
+            raise ParseError(txt['parse-fail'].format(detokenize(tokens)))
         return rval
 
     # -------------------------------------------------------------------------
-    def parse_weekday(self, expr, result, start):
+    def plan_weekday(self, tokens, found):
         """
-        Parse expressions like 'next monday', 'last wednesday', etc. (class
-        Parser)
+        Steps for 'next monday', 'last wednesday', etc. *found* is the weekday
+        token. (class Parser)
         """
-        wday = result[0].group()
-        wb = word_before(wday, expr)
+        wb = word_before(found, tokens)
         if wb == 'next':
-            swd = start('%A').lower()
-            delta = self.wk.forediff(swd, wday) or 7
-            rval = moment(start.epoch() + delta * self.tu.magnitude('day'))
+            rval = [('next_wday', found.value)]
         elif wb == 'last':
-            swd = start('%A').lower()
-            delta = self.wk.backdiff(swd, wday) or 7
-            rval = moment(start.epoch() - delta * self.tu.magnitude('day'))
+            rval = [('last_wday', found.value)]
+        else:
+            raise ParseError(txt['parse-fail'].format(detokenize(tokens)))
         return rval
 
     # -------------------------------------------------------------------------
-    def parse_yestermorrow(self, expr, start):
+    def plan_yestermorrow(self, tokens):
         """
-        Handle 'yesterday', 'today', 'tomorrow'. Decided that 'today' should
-        return the same as 'now' and that 'yesterday' and 'tomorrow' are offset
-        from now by a day's magnitude in opposite directions. The other option
-        would be to have each of these resolve to the floor of a day. If floor
-        is what is desired, we can always do m = <parser>('today').floor().
-        (class Parser)
+        Steps for 'yesterday', 'today', 'now', 'tomorrow' (class Parser)
+        """
+        day = self.tu.magnitude('day')
+        return {'yesterday': [('shift', -1 * day)],
+                'tomorrow': [('shift', day)]}.get(detokenize(tokens), [])
+
+    # -------------------------------------------------------------------------
+    def count_units(self, tokens):
+        """
+        Returns the number of seconds in the leading count and unit of an 'ago'
+        or 'from now' expression like 'three weeks ago' (class Parser)
+        """
+        if tokens and tokens[0].kind == 'number':
+            count = tokens[0].value
+        else:
+            count = 1
+        unit = self.tu.find_unit(tokens)
+        if unit is None:
+            raise ValueError(txt['no-unit'].format(detokenize(tokens)))
+        return count * self.tu.magnitude(unit)
+
+    # -------------------------------------------------------------------------
+    def keyword(self, tokens, text):
+        """
+        Returns the first token in *tokens* whose text is *text* or raises
+        ParseError (class Parser)
         """
-        if expr == 'yesterday':
-            rval = moment(start.epoch() - self.tu.magnitude('day'))
-        elif expr in ['today', 'now']:
-            rval = start
-        elif expr == 'tomorrow':
-            rval = moment(start.epoch() + self.tu.magnitude('day'))
+        for tok in tokens:
+            if tok.text == text:
+                return tok
+        raise ParseError(txt['parse-fail'].format(detokenize(tokens)))
+
+    # -------------------------------------------------------------------------
+    def lap(self, record, stage, since):
+        """
+        Adds the time from *since* to now to *stage* in *record* and returns
+        now (class Parser)
+        """
+        now = time.perf_counter()
+        record['time'][stage] += now - since
+        return now
+
+    # -------------------------------------------------------------------------
+    def reject_info(self):
+        """
+        Returns a dict reporting how many expressions were turned away from
+        self.rejects, how many failed the long way, and the current and
+        maximum number of rejects remembered (class Parser)
+        """
+        with self.lock:
+            return {'rejected': self.rejected,
+                    'failed': self.failed,
+                    'size': len(self.rejects),
+                    'maxsize': self.reject_size}
+
+    # -------------------------------------------------------------------------
+    def resolve(self, expr, start):
+        """
+        Does the work of __call__(): compiles *expr* and runs it from *start*
+        (default: now), going through the result cache if it is enabled. The
+        cache holds nanosecond counts, so each hit is a new moment that the
+        caller is free to change. (class Parser)
+        """
+        start = start or moment()
+        plan = self.compile(expr)
+        if not self.cache_size:
+            return self.evaluate(plan, start)
+
+        tzstate = (getattr(moment, 'deftz', None), os.environ.get('TZ'))
+        if plan.steps and plan.steps[0][0] in Plan.absolute:
+            key = (plan.expr, plan.granule(start.moment))
+        else:
+            key = (plan.expr, start.ns)
+        with self.lock:
+            if tzstate != self.cache_tz:
+                self.cache.clear()
+                self.cache_tz = tzstate
+            rval = self.cache.get(key)
+            if rval is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.cache.move_to_end(key)
+        if rval is not None:
+            if self.local.record is not None:
+                self.local.record['cached'] = True
+            return moment.from_ns(rval)
+
+        rval = self.evaluate(plan, start)
+        with self.lock:
+            if tzstate == self.cache_tz:
+                self.cache[key] = rval.ns
+                if self.cache_size < len(self.cache):
+                    self.cache.popitem(last=False)
+        return rval
+
+    # -------------------------------------------------------------------------
+    def session(self, start=None):
+        """
+        Returns a Session for parsing an expression as it is typed, resolved
+        against *start* (class Parser)
+        """
+        return Session(self, start)
+
+    # -------------------------------------------------------------------------
+    def stats(self):
+        """
+        Returns a snapshot of the instrumentation totals: the number of calls,
+        calls per rule, seconds spent in each stage, the summed counts, and
+        the record of the slowest call (class Parser)
+        """
+        with self.lock:
+            rval = dict(self.totals)
+            rval['rules'] = dict(self.totals['rules'])
+            rval['time'] = dict(self.totals['time'])
         return rval
 
+    # -------------------------------------------------------------------------
+    def stats_clear(self):
+        """
+        Resets the instrumentation totals (class Parser)
+        """
+        totals = {'calls': 0, 'rules': collections.Counter(),
+                  'time': dict.fromkeys(self.stages, 0.0),
+                  'slowest': None}
+        totals.update(dict.fromkeys(self.counts, 0))
+        with self.lock:
+            self.totals = totals
+
+    # -------------------------------------------------------------------------
+    def tally(self, rec):
+        """
+        Adds the record *rec* of one call to the totals (class Parser)
+        """
+        totals = self.totals
+        totals['calls'] += 1
+        totals['rules'][rec['rule']] += 1
+        for stage in self.stages:
+            totals['time'][stage] += rec['time'][stage]
+        for name in self.counts:
+            totals[name] += rec[name]
+        slowest = totals['slowest']
+        if slowest is None or slowest['time']['total'] < rec['time']['total']:
+            totals['slowest'] = rec
+
     # -------------------------------------------------------------------------
     def research(self, pattern, text, result):
         """
@@ -1350,6 +2290,203 @@ class Parser(object):
         return q
 
 
+# -----------------------------------------------------------------------------
+class Plan(object):
+    """
+    A natural language time expression reduced by Parser.compile() to a list
+    of steps, each of which maps an epoch to a new epoch. Calling the plan with
+    an anchor runs the steps on the anchor's epoch and returns a moment without
+    looking at the expression text again. The steps are tuples of strings and
+    ints, so plans pickle and compare by value.
+
+    Steps:
+        ('shift', secs)         add *secs* seconds
+        ('floor', unit, n)      beginning of the *unit* that is *n* units away
+                                from the one containing the epoch (UTC)
+        ('ceiling', unit)       last second of the containing *unit* (UTC)
+        ('on_or_after', wday)   forward 0 to 6 days to weekday *wday* (UTC)
+        ('next_wday', wday)     forward 1 to 7 days to weekday *wday* (local)
+        ('last_wday', wday)     back 1 to 7 days to weekday *wday* (local)
+        ('year', n)             Jan 1 of the local year + *n* (default tz)
+        ('month_of', mon)       the 1st of month *mon* in the UTC year
+                                (default tz)
+
+    The steps work in whole seconds. Any fraction of a second in the anchor is
+    carried through the relative steps (shift, on_or_after, next_wday,
+    last_wday) and dropped by the first of the absolute ones.
+    """
+    absolute = frozenset(['floor', 'ceiling', 'year', 'month_of'])
+    day = 24 * 3600
+
+    # -------------------------------------------------------------------------
+    def __init__(self, expr, steps, rule=None):
+        """
+        Store *expr* for reference, the simplified *steps*, and the name of
+        the Parser *rule* that produced them (class Plan)
+        """
+        self.expr = expr
+        self.steps = self.simplify(steps)
+        self.rule = rule
+
+    # -------------------------------------------------------------------------
+    def __call__(self, anchor=None, memo=None):
+        """
+        Runs the steps starting from *anchor* (a moment or an epoch, default
+        now) and returns the resulting moment. *memo* is an optional dict
+        shared by calls with the same anchor so that floors and broken-down
+        times are only computed once. (class Plan)
+        """
+        if anchor is None:
+            anchor = moment()
+        if not self.steps and isinstance(anchor, moment):
+            return anchor
+        count = anchor.ns if isinstance(anchor, moment) else _ns(anchor)
+        epoch, frac = divmod(count, 1000000000)
+        for step in self.steps:
+            epoch = self.step(epoch, step, memo)
+            if step[0] in self.absolute:
+                frac = 0
+        return moment.from_ns(int(epoch) * 1000000000 + frac)
+
+    # -------------------------------------------------------------------------
+    def __eq__(self, other):
+        """
+        Plans are equal if their expressions and steps are (class Plan)
+        """
+        if not isinstance(other, Plan):
+            return NotImplemented
+        return (self.expr, self.steps) == (other.expr, other.steps)
+
+    # -------------------------------------------------------------------------
+    def __hash__(self):
+        """
+        Hash on the same values as __eq__ (class Plan)
+        """
+        return hash((self.expr, self.steps))
+
+    # -------------------------------------------------------------------------
+    def __repr__(self):
+        """
+        Return an object representation suitable to be processed by eval (class
+        Plan)
+        """
+        return "nldt.Plan({!r}, {!r})".format(self.expr, self.steps)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def simplify(steps):
+        """
+        Returns *steps* as a tuple with adjacent shifts added together, zero
+        shifts dropped, and adjacent floors of the same unit combined. Once an
+        epoch has been floored to a unit, flooring it again is a no-op, so
+        ('floor', 'week', 1), ('floor', 'week', 1) is ('floor', 'week', 2).
+        (class Plan)
+        """
+        rval = []
+        for step in steps:
+            prev = rval[-1] if rval else (None,)
+            if step[0] == 'shift' and prev[0] == 'shift':
+                rval[-1] = ('shift', prev[1] + step[1])
+            elif (step[0] == 'floor' and prev[0] == 'floor' and
+                  step[1] == prev[1]):
+                rval[-1] = ('floor', step[1], prev[2] + step[2])
+            else:
+                rval.append(tuple(step))
+            if rval[-1] == ('shift', 0):
+                rval.pop()
+        return tuple(rval)
+
+    # -------------------------------------------------------------------------
+    def granule(self, epoch):
+        """
+        Returns the coarsest value derived from *epoch* that determines the
+        result of this plan. Every step depends only on the output of the
+        previous one, so the first step decides: 'last week' depends on the
+        week containing *epoch*, 'next year' on its local year, and so on.
+        (class Plan)
+        """
+        if not self.steps:
+            return epoch
+        step = self.steps[0]
+        if step[0] in ['floor', 'ceiling']:
+            rval = self.floor(epoch, step[1], 0, None)
+        elif step[0] == 'month_of':
+            rval = time.gmtime(epoch).tm_year
+        elif step[0] == 'year':
+            rval = time.localtime(epoch).tm_year
+        else:
+            rval = epoch
+        return rval
+
+    # -------------------------------------------------------------------------
+    def evaluate(self, epochs):
+        """
+        Runs the steps over a whole array of epochs at once with NumPy and
+        returns an int64 array. Element by element, the result is the same as
+        calling the plan with each epoch. See nldt.arrays.evaluate(). (class
+        Plan)
+        """
+        from nldt import arrays
+        return arrays.evaluate(self, epochs)
+
+    # -------------------------------------------------------------------------
+    def floor(self, epoch, unit, count, memo):
+        """
+        Returns the beginning of the *unit* that is *count* units away from the
+        one containing *epoch* in UTC. This is plain arithmetic, so *memo* is
+        not consulted. (class Plan)
+        """
+        return _floor_epoch(int(epoch), unit, count)
+
+    # -------------------------------------------------------------------------
+    def gmtime(self, epoch, memo, local=False):
+        """
+        Returns time.gmtime(*epoch*) (or time.localtime(*epoch*) if *local* is
+        True), looking in *memo* first if it is not None (class Plan)
+        """
+        if memo is None:
+            return time.localtime(epoch) if local else time.gmtime(epoch)
+        key = ('localtime' if local else 'gmtime', epoch)
+        if key not in memo:
+            memo[key] = time.localtime(epoch) if local else time.gmtime(epoch)
+        return memo[key]
+
+    # -------------------------------------------------------------------------
+    def step(self, epoch, step, memo):
+        """
+        Applies one *step* to *epoch* and returns the new epoch (class Plan)
+        """
+        op = step[0]
+        day = self.day
+        if op == 'shift':
+            rval = epoch + step[1]
+        elif op == 'floor':
+            rval = self.floor(epoch, step[1], step[2], memo)
+        elif op == 'ceiling':
+            if step[1] == 'second':
+                rval = epoch
+            else:
+                rval = self.floor(epoch, step[1], 1, memo) - 1
+        elif op == 'on_or_after':
+            wday = self.gmtime(epoch, memo).tm_wday
+            rval = epoch + ((step[1] - wday) % 7) * day
+        elif op == 'next_wday':
+            wday = self.gmtime(epoch, memo, local=True).tm_wday
+            rval = epoch + ((step[1] - wday - 1) % 7 + 1) * day
+        elif op == 'last_wday':
+            wday = self.gmtime(epoch, memo, local=True).tm_wday
+            rval = epoch - ((wday - step[1] - 1) % 7 + 1) * day
+        elif op == 'year':
+            year = self.gmtime(epoch, memo, local=True).tm_year + step[1]
+            rval = moment((year, 1, 1, 0, 0, 0, 0, 0, 0)).epoch()
+        elif op == 'month_of':
+            year = self.gmtime(epoch, memo).tm_year
+            rval = moment((year, step[1], 1, 0, 0, 0, 0, 0, 0)).epoch()
+        else:
+            raise ValueError(txt['plan-step'].format(step))
+        return rval
+
+
 # -----------------------------------------------------------------------------
 class prepositions(object):
     """
@@ -1364,7 +2501,7 @@ class prepositions(object):
         direction of the key -- +1 for forward in time, -1 for backward. (class
         prepositions)
         """
-        self.preps = {'of': 1, 'in': 1, 'from': 1, 'after': 1, 'before': -1}
+        self.preps = lexicon()['preps']
 
     # -------------------------------------------------------------------------
     def split(self, text):
@@ -1395,6 +2532,277 @@ class prepositions(object):
         return self.preps[prep]
 
 
+# -----------------------------------------------------------------------------
+class Session(object):
+    """
+    Parses an expression while it is being typed. Characters are fed in as
+    they arrive and only the new ones are examined: each finished word moves a
+    set of positions in the phrase templates below, which mirror the rules
+    Parser understands, and a snapshot of that set is kept per word so edits
+    can back up without starting over. No ParseError is raised for an
+    unfinished prefix; status() says whether the text so far is 'complete',
+    still 'viable', or 'dead', and completions() lists the words that could
+    come next.
+
+    Session.simple lists the templates for single expressions. The full
+    list adds '<pre> of|in <simple>', where <pre> is 'end', 'beginning', or
+    another simple template. Slots are literal word sets or one of
+    'weekday', 'month', 'unit' (the token kinds from tokenize()) or 'count'
+    (an optional 'a', 'an', or run of number words).
+    """
+    simple = [[frozenset(['today', 'tomorrow', 'yesterday', 'now'])],
+              ['month'],
+              ['count', 'unit', frozenset(['ago', 'earlier', 'later'])],
+              ['count', 'unit', frozenset(['from']), frozenset(['now'])],
+              [frozenset(['next', 'last']),
+               frozenset(['month', 'week', 'year'])],
+              [frozenset(['next', 'last']), 'weekday'],
+              [frozenset(['first', 'the', 'this']), frozenset(['week'])],
+              ['weekday', frozenset(['week'])],
+              [frozenset(['week']), frozenset(['after']), frozenset(['next'])],
+              [frozenset(['week']), frozenset(['before']),
+               frozenset(['last'])]]
+    templates = None
+    vocab = None
+    memo = collections.OrderedDict()
+    memo_lock = threading.Lock()
+    memo_size = 10000
+
+    # -------------------------------------------------------------------------
+    def __init__(self, parser=None, start=None):
+        """
+        Sets up an empty session that compiles with *parser* (default: a new
+        Parser) and resolves against *start* (default: now when result() is
+        called) (class Session)
+        """
+        self.parser = parser or Parser()
+        self.start = start
+        self.words = lexicon()['words']
+        if Session.vocab is None:
+            prep = frozenset(['of', 'in'])
+            Session.templates = self.simple + [
+                pre + [prep] + post
+                for pre in [[frozenset(['end', 'beginning'])]] + self.simple
+                for post in self.simple]
+            Session.vocab = self.vocabulary()
+        self.text = ''
+        self.partial = ''
+        self.ends = []
+        self.history = [self.closure((idx, 0)
+                                     for idx in range(len(self.templates)))]
+        self.current = self.history[0]
+        self.plans = {}
+
+    # -------------------------------------------------------------------------
+    def __repr__(self):
+        """
+        Shows the text and status (class Session)
+        """
+        return "nldt.Session({!r}: {})".format(self.text, self.status())
+
+    # -------------------------------------------------------------------------
+    def accepts(self, slot, word):
+        """
+        Returns True if *word* can fill template *slot* (class Session)
+        """
+        if isinstance(slot, frozenset):
+            return word in slot
+        kind = 'number' if word.isdigit() else self.words.get(word,
+                                                              ('word',))[0]
+        if slot == 'count':
+            return word in ['a', 'an'] or kind == 'number'
+        return kind == slot
+
+    # -------------------------------------------------------------------------
+    def advance(self, states, word):
+        """
+        Returns the template positions reached from *states* by *word*. A
+        number word leaves a 'count' slot open for the next one. Transitions
+        are remembered in Session.memo (shared by all sessions, the least
+        recently used dropped beyond Session.memo_size entries), so the set of
+        states becomes a DFA built as it is used. (class Session)
+        """
+        key = ('advance', states, word)
+        rval = self.recall(key)
+        if rval is not None:
+            return rval
+        rval = []
+        for idx, pos in states:
+            tmpl = self.templates[idx]
+            if pos < len(tmpl) and self.accepts(tmpl[pos], word):
+                if tmpl[pos] == 'count' and word not in ['a', 'an']:
+                    rval.append((idx, pos))
+                else:
+                    rval.append((idx, pos + 1))
+        rval = self.closure(rval)
+        self.remember(key, rval)
+        return rval
+
+    # -------------------------------------------------------------------------
+    def closure(self, states):
+        """
+        Returns *states* as a frozenset, adding the position after each
+        optional 'count' slot (class Session)
+        """
+        rval = set()
+        for idx, pos in states:
+            rval.add((idx, pos))
+            tmpl = self.templates[idx]
+            if pos < len(tmpl) and tmpl[pos] == 'count':
+                rval.add((idx, pos + 1))
+        return frozenset(rval)
+
+    # -------------------------------------------------------------------------
+    def completions(self):
+        """
+        Returns the sorted list of words that could be typed next. If a word
+        is in progress, these are the words that start with it. (class
+        Session)
+        """
+        key = ('completions', self.history[-1], self.partial)
+        rval = self.recall(key)
+        if rval is not None:
+            return list(rval)
+        slots = set()
+        for idx, pos in self.history[-1]:
+            tmpl = self.templates[idx]
+            if pos < len(tmpl):
+                slots.add(tmpl[pos])
+        rval = sorted([word for word in self.vocab.get(self.partial, [])
+                       if any([self.accepts(slot, word) for slot in slots])])
+        self.remember(key, tuple(rval))
+        return rval
+
+    # -------------------------------------------------------------------------
+    def feed(self, chars):
+        """
+        Appends *chars* to the text, finishing a word at each character that
+        is not a letter, digit, or apostrophe, and returns status() (class
+        Session)
+        """
+        base = len(self.text)
+        for offset, char in enumerate(chars):
+            if char.isalnum() or char in "_'":
+                self.partial += char.lower()
+            elif self.partial:
+                self.history.append(self.advance(self.history[-1],
+                                                 self.partial))
+                self.ends.append(base + offset)
+                self.partial = ''
+        self.text += chars
+        self.current = self.history[-1]
+        if self.partial:
+            self.current = self.advance(self.current, self.partial)
+        return self.status()
+
+    # -------------------------------------------------------------------------
+    def plan(self):
+        """
+        Returns the Plan for the text if some template has been filled and
+        the parser accepts it, otherwise None (class Session)
+        """
+        if not any([pos == len(self.templates[idx])
+                    for idx, pos in self.current]):
+            return None
+        expr = " ".join(re.findall(r"[\w']+", self.text.lower()))
+        if expr not in self.plans:
+            try:
+                self.plans[expr] = self.parser.compile(expr)
+            except (ParseError, ValueError):
+                self.plans[expr] = None
+        return self.plans[expr]
+
+    # -------------------------------------------------------------------------
+    def recall(self, key):
+        """
+        Returns what Session.memo holds for *key*, or None, and marks the
+        entry most recently used (class Session)
+        """
+        with self.memo_lock:
+            rval = self.memo.get(key)
+            if rval is not None:
+                self.memo.move_to_end(key)
+        return rval
+
+    # -------------------------------------------------------------------------
+    def remember(self, key, value):
+        """
+        Stores *value* in Session.memo under *key*, dropping the least
+        recently used entry if that makes more than Session.memo_size (class
+        Session)
+        """
+        with self.memo_lock:
+            self.memo[key] = value
+            if self.memo_size < len(self.memo):
+                self.memo.popitem(last=False)
+
+    # -------------------------------------------------------------------------
+    def result(self):
+        """
+        Returns the moment the text resolves to if it is complete, otherwise
+        None (class Session)
+        """
+        plan = self.plan()
+        if plan is None:
+            return None
+        return plan(self.start or moment())
+
+    # -------------------------------------------------------------------------
+    def status(self):
+        """
+        Returns 'complete' if the text resolves as it stands, 'viable' if
+        more typing could make it resolve, or 'dead' (class Session)
+        """
+        if self.plan() is not None:
+            return 'complete'
+        if self.partial:
+            if self.current or self.completions():
+                return 'viable'
+        elif any([pos < len(self.templates[idx])
+                  for idx, pos in self.current]):
+            return 'viable'
+        return 'dead'
+
+    # -------------------------------------------------------------------------
+    def update(self, text):
+        """
+        Replaces the text with *text*, the whole current contents of an input
+        field, and returns status(). Text shared with the previous value is
+        not examined again, so typing or deleting a character only costs the
+        word it is in. (class Session)
+        """
+        keep = 0
+        limit = min(len(text), len(self.text))
+        while keep < limit and text[keep] == self.text[keep]:
+            keep += 1
+        if keep == len(self.text):
+            return self.feed(text[keep:])
+
+        while self.ends and keep <= self.ends[-1]:
+            self.ends.pop()
+            self.history.pop()
+        base = self.ends[-1] + 1 if self.ends else 0
+        self.text = text[:base]
+        self.partial = ''
+        return self.feed(text[base:])
+
+    # -------------------------------------------------------------------------
+    def vocabulary(self):
+        """
+        Returns a dict mapping every prefix (including '') of every word a
+        template slot can take to the list of those words (class Session)
+        """
+        rval = {}
+        words = set(self.words) | set(['a', 'an', 'ago', 'earlier', 'later',
+                                       'now', 'end', 'beginning', 'the',
+                                       'today', 'tomorrow', 'yesterday',
+                                       'after'])
+        for word in words:
+            for end in range(len(word) + 1):
+                rval.setdefault(word[0:end], []).append(word)
+        return rval
+
+
 # -----------------------------------------------------------------------------
 class time_units(object):
     """
@@ -1406,19 +2814,18 @@ class time_units(object):
         Sets up the list of units with the number of seconds in each (class
         time_units)
         """
-        self._units = {'second': 1,
-                       'minute': 60,
-                       'hour': 3600,
-                       'day': 24 * 3600,
-                       'week': 7 * 24 * 3600,
-                       'month': 30 * 24 * 3600,
-                       'year': 365 * 24 * 3600}
+        self._units = lexicon()['units']
 
     # -------------------------------------------------------------------------
     def find_unit(self, text):
         """
-        Scans *text* and return the first unit found or None (class time_units)
+        Scans *text* and return the first unit found or None. *text* may also
+        be a list of Tokens, in which case the first unit in unit_list() order
+        named by one of them is returned. (class time_units)
         """
+        if not isinstance(text, str):
+            named = set(tok.value for tok in text if tok.kind == 'unit')
+            return next((unit for unit in self._units if unit in named), None)
         found = [unit for unit in self._units.keys()
                  if re.search(r"(^|\W){}s?(\W|$)".format(unit), text)]
         if found:
@@ -1442,6 +2849,18 @@ class time_units(object):
         return self._units.keys()
 
 
+# -----------------------------------------------------------------------------
+class Token(collections.namedtuple('Token', ['kind', 'text', 'value',
+                                             'pos'])):
+    """
+    One word (or run of number words) of an expression, as produced by
+    tokenize(). *kind* says what the word is, *text* is the lowercased word,
+    *value* is what it means (see tokenize()), and *pos* is its index in the
+    token list.
+    """
+    __slots__ = ()
+
+
 # -----------------------------------------------------------------------------
 class week(Indexable):
     """
@@ -1450,19 +2869,11 @@ class week(Indexable):
     # -------------------------------------------------------------------------
     def __init__(self):
         """
-        Sets up week info (class week)
+        Sets up week info. The table is shared with every other week object
+        (see lexicon()). (class week)
         """
-        self._dict = {}
-        for idx in range(0, 7):
-            q = moment("2018.01{:02d}".format(idx+1))
-            wname = q('%A', otz='utc').lower()
-            abbr = wname[0:3]
-            this = {'name': wname,
-                    'abbr': abbr,
-                    'idx': idx,
-                    }
-            self._dict[abbr] = this
-            self._dict[idx] = this
+        self._dict = lexicon()['week']
+        self._alias = lexicon()['week_alias']
 
     # -------------------------------------------------------------------------
     def day_list(self):
@@ -1623,6 +3034,60 @@ def clock():
     return time.clock()
 
 
+# -----------------------------------------------------------------------------
+def _civil_from_days(days):
+    """
+    Converts a count of *days* since 1970-01-01 into a (year, month, day)
+    tuple in the proleptic Gregorian calendar. *days* may be an int or an
+    integer array, in which case the three results are arrays.
+
+    This is H. Hinnant's days-to-civil algorithm. It only uses integer floor
+    division and remainder, so it is exact for any year.
+    """
+    days = days + 719468
+    era = days // 146097
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    mday = doy - (153 * mp + 2) // 5 + 1
+    mon = (mp + 2) % 12 + 1
+    return yoe + era * 400 + (mon <= 2), mon, mday
+
+
+# -----------------------------------------------------------------------------
+def _days_from_civil(year, mon, mday):
+    """
+    Converts *year*, *mon*, *mday* into the count of days since 1970-01-01.
+    This is the inverse of _civil_from_days() and accepts ints or integer
+    arrays the same way.
+    """
+    year = year - (mon <= 2)
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * ((mon + 9) % 12) + 2) // 5 + mday - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+# -----------------------------------------------------------------------------
+def _defers(other):
+    """
+    Returns True if *other* is of a type that sets __array_ufunc__ to None,
+    NumPy's sign that its reflected operators (__radd__, __rsub__) should
+    handle mixed arithmetic. The column types in nldt.arrays do this.
+    """
+    return getattr(type(other), '__array_ufunc__', False) is None
+
+
+# -----------------------------------------------------------------------------
+def detokenize(tokens):
+    """
+    Returns the text of *tokens* joined by single spaces
+    """
+    return " ".join([tok.text for tok in tokens])
+
+
 # -----------------------------------------------------------------------------
 def dst(when=None, tz=None):
     """
@@ -1665,6 +3130,191 @@ def dst(when=None, tz=None):
         return False
 
 
+# -----------------------------------------------------------------------------
+def extract(stream, start=None, parser=None):
+    """
+    Finds the date/time expressions that *parser* (default: a new Parser)
+    understands in *stream*, a str or an iterable of str chunks such as an open
+    file, and yields a ((begin, end), moment) tuple for each one. begin and end
+    are character offsets into the whole stream. Each expression is resolved
+    against *start* (default: now, taken once).
+
+    The text is scanned once, a word at a time. Each word is looked up in
+    lexicon()['words'], which is built from the week, month, time_units, and
+    numberize vocabularies. Only runs of adjacent date words are handed to the
+    parser, and a candidate never begins with a preposition or an article, so
+    the 'in' of 'call me in two days' cannot change the count. Of the
+    candidates the parser understands, the one whose plan depends on the most
+    words wins, trimmed to them ('from last week' is reported as 'last week').
+    A month name on its own only counts if it is capitalized, so the 'may' in
+    'you may' is not taken for May 1.
+
+    Example:
+        >>> anchor = nldt.moment('2018-10-16 12:00:00', itz='utc')
+        >>> text = "Filed three days ago, due next monday."
+        >>> [(span, m('%F')) for span, m in nldt.extract(text, anchor)]
+        [((6, 20), '2018-10-13'), ((26, 37), '2018-10-22')]
+    """
+    if isinstance(stream, str):
+        stream = [stream]
+    start = start or moment()
+    parser = parser or Parser()
+    words = lexicon()['words']
+    glue = frozenset(['a', 'an', 'the', 'ago', 'end', 'beginning'])
+    lead = frozenset(['a', 'an', 'the'])
+    bare = frozenset(['now', 'today', 'tomorrow', 'yesterday'])
+    wordrx = re.compile(r"[\w']+")
+    seprx = re.compile(r"[\s-]*")
+    maxrun = 8
+    maxword = max([len(word) for word in words] + [19])
+    plans = {}
+    memo = {}
+
+    # A run item is (begin, end, word, kind, key, capitalized): begin and end
+    # are offsets into the whole stream, and key says whether the word can
+    # anchor an expression on its own
+    def compiled(run):
+        if not any([item[4] for item in run]):
+            return None
+        expr = " ".join([item[2] for item in run])
+        if expr not in plans:
+            try:
+                plans[expr] = parser.compile(expr)
+            except (ParseError, ValueError):
+                plans[expr] = None
+        plan = plans[expr]
+        if (plan and len(run) == 1 and run[0][2] in parser.mon_names and
+                not run[0][5]):
+            plan = None
+        return plan
+
+    def same(plan, other):
+        return other is not None and other.steps == plan.steps
+
+    def trimmed(run, low, high, plan):
+        while low + 1 < high and same(plan, compiled(run[low + 1:high])):
+            low += 1
+        while low + 1 < high and same(plan, compiled(run[low:high - 1])):
+            high -= 1
+        return low, high
+
+    def matches(run):
+        low = 0
+        while low < len(run):
+            if run[low][2] in lead or run[low][3] == 'prep':
+                low += 1
+                continue
+            best = None
+            for high in range(len(run), low, -1):
+                plan = compiled(run[low:high])
+                if plan:
+                    span = trimmed(run, low, high, plan)
+                    if best is None or span[1] - span[0] > best[1] - best[0]:
+                        best = span + (plan,)
+            if best is None:
+                low += 1
+                continue
+            first, last, plan = best
+            yield (run[first][0], run[last - 1][1]), plan(start, memo)
+            low = last
+
+    run, pending, base, skip = [], '', 0, False
+    for chunk in itertools.chain(stream, [None]):
+        done = chunk is None
+        chunk = chunk or ''
+        if skip:
+            # the rest of a word too long to be a date word
+            tail = wordrx.match(chunk)
+            cut = tail.end() if tail else 0
+            base += cut
+            skip = (cut == len(chunk) and not done)
+            if skip:
+                continue
+            chunk = chunk[cut:]
+        pending += chunk
+        found = list(wordrx.finditer(pending))
+        partial = None
+        if not done and found and found[-1].end() == len(pending):
+            partial = found.pop()
+
+        last = 0
+        for match in found:
+            if not seprx.fullmatch(pending, last, match.start()):
+                yield from matches(run)
+                run = []
+            last = match.end()
+            word = match.group().lower()
+            kind = 'number' if word.isdigit() else words.get(word,
+                                                             ('word',))[0]
+            if word == 'and' and not (run and run[-1][3] == 'number'):
+                kind = 'word'
+            if len(word) > maxword or (kind == 'word' and
+                                       word not in glue | bare):
+                yield from matches(run)
+                run = []
+                continue
+            item = (base + match.start(), base + match.end(), word, kind,
+                    kind in ['unit', 'weekday', 'month'] or word in bare,
+                    match.group()[0].isupper())
+            if len(run) < maxrun:
+                run.append(item)
+            else:
+                yield from matches(run)
+                run = [item]
+
+        cut = partial.start() if partial else len(pending)
+        if not seprx.fullmatch(pending, last, cut):
+            yield from matches(run)
+            run = []
+        if partial and partial.end() - cut > maxword:
+            yield from matches(run)
+            run = []
+            cut, skip = len(pending), True
+        base += cut
+        pending = pending[cut:]
+    yield from matches(run)
+
+
+# -----------------------------------------------------------------------------
+def _floor_epoch(epoch, unit, count=0, first=0):
+    """
+    Returns the first second of the *unit* that is *count* units away from
+    the one containing *epoch* in UTC. Weeks begin on weekday *first* (0 is
+    monday; see _week_first()).
+
+    Everything is integer arithmetic on the epoch and on its day count
+    (_civil_from_days() and back), so no struct_time is built and any year
+    works, not just those in the platform's time_t. *epoch* may also be an
+    int64 array, which is how nldt.arrays uses it.
+    """
+    size = _CLOCK_UNITS.get(unit)
+    if size is not None:
+        return epoch - epoch % size + count * size
+    days = epoch // 86400
+    if unit == 'week':
+        return (days - (days + 3 - first) % 7 + 7 * count) * 86400
+    elif unit == 'month':
+        year, mon, _ = _civil_from_days(days)
+        mon = mon - 1 + count
+    elif unit == 'year':
+        year, mon = _civil_from_days(days)[0], 12 * count
+    else:
+        raise ValueError(txt['not-timeu'].format(unit))
+    return _days_from_civil(year + mon // 12, mon % 12 + 1, 1) * 86400
+
+
+# -----------------------------------------------------------------------------
+def __getattr__(name):
+    """
+    Hands out the NumPy-backed column types (see nldt.arrays) on first use,
+    so that importing nldt does not require NumPy
+    """
+    if name in _ARRAY_TYPES:
+        from nldt import arrays
+        return getattr(arrays, name)
+    raise AttributeError(txt['no-attr'].format(__name__, name))
+
+
 # -----------------------------------------------------------------------------
 def isnum(strval):
     """
@@ -1676,6 +3326,148 @@ def isnum(strval):
         return False
 
 
+# -----------------------------------------------------------------------------
+def _aliases(table):
+    """
+    Builds the read-only alias map for a lexicon *table* (see class Indexable)
+    """
+    rval = {}
+    for key, this in table.items():
+        if isinstance(key, int):
+            rval[key] = this['idx']
+            rval[str(key)] = this['idx']
+            rval["{:02d}".format(key)] = this['idx']
+            name = this['name']
+            for end in range(len(this['abbr']), len(name) + 1):
+                rval[name[0:end]] = this['idx']
+    return types.MappingProxyType(rval)
+
+
+# -----------------------------------------------------------------------------
+def _iso_epoch(text):
+    """
+    Reads an ISO 8601 / RFC 3339 date and time,
+
+        YYYY-MM-DD[(T|t| )HH[:MM[:SS[(.|,)fraction]][Z|z|(+|-)HH[[:]MM]]]]
+
+    and returns the tuple (epoch, offset, fraction). The epoch is the seconds
+    since 1970 of the wall clock time as if it were UTC, the offset is the
+    seconds east of UTC given in the string, or None if the string has none,
+    and the fraction is the nanoseconds (digits past the ninth are dropped).
+    Returns None if *text* is not of that form or names a day that does not
+    exist, so the caller can fall back to moment.formats.
+    """
+    found = _ISO.fullmatch(text)
+    if found is None:
+        return None
+    (year, mon, day, hour, minute, sec, frac,
+     zulu, sign, ohour, omin) = found.groups()
+    year, mon, day = int(year), int(mon), int(day)
+    hour, minute, sec = int(hour or 0), int(minute or 0), int(sec or 0)
+    if mon == 2 and day == 29:
+        good = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    else:
+        good = 0 < mon < 13 and 0 < day <= _ISO_DAYS[mon]
+    if not good or year < 1 or 23 < hour or 59 < minute or 61 < sec:
+        return None
+
+    epoch = (_days_from_civil(year, mon, day) * 86400 +
+             hour * 3600 + minute * 60 + sec)
+    frac = int(frac[:9].ljust(9, '0')) if frac else 0
+
+    if zulu:
+        return (epoch, 0, frac)
+    elif sign:
+        ohour, omin = int(ohour), int(omin or 0)
+        if 23 < ohour or 59 < omin:
+            return None
+        offset = ohour * 3600 + omin * 60
+        return (epoch, -offset if sign == '-' else offset, frac)
+    return (epoch, None, frac)
+
+
+# -----------------------------------------------------------------------------
+def lexicon():
+    """
+    Returns the read-only word tables shared by every Parser, week, month,
+    time_units, and prepositions object. They are built on first use and kept
+    for the life of the process. The weekday and month names come from
+    time.strftime(), so they follow the locale in effect at that time.
+
+    Keys:
+        'week'          weekday entries ({'name', 'abbr', 'idx'}) by
+                        abbreviation and by index (mon = 0)
+        'month'         month entries ({'name', 'abbr', 'idx', 'days'}) by
+                        abbreviation and by index (jan = 1)
+        'mon_names'     frozenset of lowercase full month names
+        'week_alias'    index by name, prefix, digit string, or int (see
+        'month_alias'   class Indexable)
+        'units'         seconds in each time unit
+        'preps'         temporal direction of each preposition
+        'words'         (kind, value) for each word tokenize() knows (see
+                        there; number words map to ('number', None))
+    """
+    global _lexicon
+    if _lexicon is not None:
+        return _lexicon
+
+    wdays = {}
+    for idx in range(0, 7):
+        # 2018-01-01 was a Monday
+        tm = time.gmtime(calendar.timegm((2018, 1, idx + 1, 0, 0, 0)))
+        wname = time.strftime('%A', tm).lower()
+        this = types.MappingProxyType({'name': wname,
+                                       'abbr': wname[0:3],
+                                       'idx': idx})
+        wdays[this['abbr']] = this
+        wdays[idx] = this
+
+    months = {}
+    for midx in range(1, 13):
+        tm = time.gmtime(calendar.timegm((2010, midx, 1, 0, 0, 0)))
+        mname = time.strftime('%B', tm).lower()
+        this = types.MappingProxyType({'name': mname,
+                                       'abbr': mname[0:3],
+                                       'idx': midx,
+                                       'days': calendar.monthrange(2010,
+                                                                   midx)[1]})
+        months[this['abbr']] = this
+        months[midx] = this
+
+    units = {'second': 1,
+             'minute': 60,
+             'hour': 3600,
+             'day': 24 * 3600,
+             'week': 7 * 24 * 3600,
+             'month': 30 * 24 * 3600,
+             'year': 365 * 24 * 3600}
+    preps = {'of': 1, 'in': 1, 'from': 1, 'after': 1, 'before': -1}
+
+    words = dict.fromkeys(numberize.vocabulary(), ('number', None))
+    words.update({'next': ('modifier', 1),
+                  'last': ('modifier', -1),
+                  'this': ('modifier', 0)})
+    words.update({word: ('prep', way) for word, way in preps.items()})
+    for idx in range(1, 13):
+        words[months[idx]['name']] = ('month', idx)
+    for idx in range(0, 7):
+        words[wdays[idx]['name']] = ('weekday', idx)
+    for unit in units:
+        words[unit] = words[unit + 's'] = ('unit', unit)
+
+    _lexicon = types.MappingProxyType({
+        'week': types.MappingProxyType(wdays),
+        'month': types.MappingProxyType(months),
+        'mon_names': frozenset(months[x]['name'] for x in range(1, 13)),
+        'week_alias': _aliases(wdays),
+        'month_alias': _aliases(months),
+        'units': types.MappingProxyType(units),
+        'preps': types.MappingProxyType(preps),
+        'words': types.MappingProxyType(words),
+        })
+    return _lexicon
+
+
 # -----------------------------------------------------------------------------
 def offset_list(tzname):
     """
@@ -1699,6 +3491,90 @@ def offset_list(tzname):
     return rval
 
 
+# -----------------------------------------------------------------------------
+def _ns(seconds):
+    """
+    Returns the int nanoseconds in *seconds*, which may be an int, a float, a
+    Fraction, or a Decimal. The whole seconds are split off first, so a float
+    epoch keeps all the precision it has in its fraction.
+    """
+    if isinstance(seconds, int):
+        return seconds * 1000000000
+    whole = math.floor(seconds)
+    return whole * 1000000000 + round((seconds - whole) * 1000000000)
+
+
+# -----------------------------------------------------------------------------
+def _shape(text):
+    """
+    Reduces a date/time string to its shape: each run of digits becomes '9',
+    each run of letters 'a', and each run of white space a single blank.
+    Anything else is kept as it is. So 'Oct 16, 2018 12:30' becomes
+    'a 9, 9 9:9'.
+    """
+    text = _SHAPE_DIGITS.sub('9', text)
+    text = _SHAPE_ALPHA.sub('a', text)
+    return _SHAPE_SPACE.sub(' ', text)
+
+
+# -----------------------------------------------------------------------------
+def _zone_info(epoch, tz):
+    """
+    Returns (offset in seconds, isdst, zone name) for zone *tz* at *epoch*.
+    The transitions of each zone are turned into epochs once and kept in
+    _ZONES, so the lookup is a bisection rather than a trip through pytz and
+    datetime. pytz lists transitions only up to 2037, so after the last one
+    in a table that runs that far, the zone's ongoing rule is taken from
+    zoneinfo, the way the C library reads it; otherwise the last transition
+    holds for all later times.
+    """
+    starts, infos = _zone_table(tz)
+    idx = bisect.bisect_right(starts, epoch) - 1
+    if idx == len(starts) - 1 and starts[-1] >= _ZONE_HORIZON and zoneinfo:
+        try:
+            when = datetime.fromtimestamp(epoch, zoneinfo.ZoneInfo(tz))
+        except (OverflowError, OSError, ValueError, LookupError):
+            return infos[idx]
+        return (int(when.utcoffset().total_seconds()), int(bool(when.dst())),
+                when.tzname())
+    return infos[max(0, idx)]
+
+
+# -----------------------------------------------------------------------------
+def _zone_table(tz):
+    """
+    Returns (starts, infos) for zone *tz*: the sorted list of epochs at which
+    its transitions take effect and, for each, the (offset in seconds, isdst,
+    zone name) tuple that holds from then on. Built on first use and kept in
+    _ZONES.
+    """
+    table = _ZONES.get(tz)
+    if table is None:
+        zone = pytz.timezone(tz)
+        if hasattr(zone, '_utc_transition_times'):
+            base = datetime(1970, 1, 1)
+            table = ([int((when - base).total_seconds())
+                      for when in zone._utc_transition_times],
+                     [(int(off.total_seconds()), int(bool(dst)), name)
+                      for off, dst, name in zone._transition_info])
+        else:
+            when = datetime(1970, 1, 1)
+            table = ([0], [(int(zone.utcoffset(when).total_seconds()), 0,
+                            zone.tzname(when))])
+        _ZONES[tz] = table
+    return table
+
+
+# -----------------------------------------------------------------------------
+def subtokens(tokens, start, end=None):
+    """
+    Returns the tokens from *start* up to *end* renumbered from 0, so they can
+    be handled like the tokens of a separate expression
+    """
+    return [tok._replace(pos=idx)
+            for idx, tok in enumerate(tokens[start:end])]
+
+
 # -----------------------------------------------------------------------------
 def timegm(*args):
     """
@@ -1707,12 +3583,57 @@ def timegm(*args):
     return calendar.timegm(*args)
 
 
+# -----------------------------------------------------------------------------
+def tokenize(expr):
+    """
+    Splits *expr* into a list of Tokens in one pass. Words are lowercased and
+    classified by a single lookup in lexicon()['words']. Kinds and values:
+
+        'number'    digits or a run of number words ('twenty three', 'first');
+                    the int
+        'unit'      'day', 'weeks', etc.; the singular unit name
+        'weekday'   full weekday name; the index (mon = 0)
+        'month'     full month name; the index (jan = 1)
+        'prep'      'of', 'in', 'from', 'after', 'before'; the direction
+        'modifier'  'next', 'last', 'this'; 1, -1, or 0
+        'word'      anything else; None
+
+    Example:
+        >>> [(t.kind, t.value) for t in tokenize('three weeks ago')]
+        [('number', 3), ('unit', 'week'), ('word', None)]
+    """
+    words = lexicon()['words']
+    rval = []
+    run = []
+
+    def flush():
+        if run:
+            value = numberize.subscan(" ".join(run))[0]
+            rval.append(Token('number', " ".join(run), value, len(rval)))
+            del run[:]
+
+    for word in re.findall(r"[\w']+", expr.lower()):
+        kind, value = words.get(word, ('word', None))
+        if kind == 'number' and (run or word != 'and'):
+            run.append(word)
+            continue
+        flush()
+        if word.isdigit():
+            kind, value = 'number', int(word)
+        elif kind == 'number':
+            kind = 'word'
+        rval.append(Token(kind, word, value, len(rval)))
+    flush()
+    return rval
+
+
 # -----------------------------------------------------------------------------
 @contextlib.contextmanager
 def tz_context(tzname=None, year=None):
     """
     This context manager sets the local timezone to *zone* during the yield and
-    back to the original setting afterward
+    back to the original setting afterward. The setting is process-wide, so
+    other threads see it too; nldt itself does not use this.
     """
     tzorig = os.getenv('TZ')
     year = year or datetime.now().year
@@ -1722,6 +3643,8 @@ def tz_context(tzname=None, year=None):
 
     os.environ['TZ'] = tzstring(tzname)
     # os.environ['TZ'] = tzname
+    if _local.tally is not None:
+        _local.tally['tzset'] += 1
     time.tzset()
 
     yield
@@ -1730,6 +3653,8 @@ def tz_context(tzname=None, year=None):
         os.environ['TZ'] = tzorig
     elif 'TZ' in os.environ:
         del os.environ['TZ']
+    if _local.tally is not None:
+        _local.tally['tzset'] += 1
     time.tzset()
 
 
@@ -1750,12 +3675,15 @@ def tzname(tz=None, epoch=None):
 # -----------------------------------------------------------------------------
 def tzset(zone=None):
     """
-    Set os.environ['TZ'] and call time.tzset() to influence time calculations
+    Set os.environ['TZ'] and call time.tzset() to influence time calculations.
+    Like tz_context(), this affects every thread in the process.
     """
     if zone:
         os.environ['TZ'] = zone
     elif 'TZ' in os.environ:
         del os.environ['TZ']
+    if _local.tally is not None:
+        _local.tally['tzset'] += 1
     time.tzset()
 
 
@@ -1785,6 +3713,8 @@ def utc_offset(epoch=None, tz=None):
     epoch = epoch or time.time()
     if not isinstance(epoch, numbers.Number):
         raise TypeError(txt['utc-offset'])
+    if _local.tally is not None:
+        _local.tally['utc_offset'] += 1
 
     tz = tz or 'local'
     if tz == 'local':
@@ -1804,11 +3734,36 @@ def version():
     return verinfo._version
 
 
+# -----------------------------------------------------------------------------
+def _week_first(unit, start):
+    """
+    Returns the index (0 is monday) of the weekday *start* names, for
+    _floor_epoch(). Raises ValueError if *start* is given with a *unit* other
+    than 'week' or is not a weekday. The index for each *start* is found once
+    and kept in _STARTS.
+    """
+    if not start:
+        return 0
+    elif unit != 'week':
+        raise ValueError(txt['start-inv01'])
+    rval = _STARTS.get(start)
+    if rval is None:
+        wk = week()
+        if all([start not in x for x in wk.day_list()]):
+            raise ValueError(txt['start-inv02'])
+        rval = _STARTS[start] = wk.index(start)
+    return rval
+
+
 # -----------------------------------------------------------------------------
 def word_before(item, text):
     """
-    Parse out the word that occurs before *item* in *text* and return it
+    Parse out the word that occurs before *item* in *text* and return it. If
+    *text* is a list of Tokens and *item* one of them, the text of the token
+    before it is returned, or None if it comes first.
     """
+    if isinstance(item, Token):
+        return text[item.pos - 1].text if item.pos else None
     next = False
     for word in reversed(text.split()):
         if next:
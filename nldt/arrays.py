@@ -0,0 +1,1122 @@
+"""
+nldt - Natural Language Date/Time support
+Copyright (c) 2017 - <the end of time>  Tom Barron
+See file LICENSING for details
+-------------------------------------------------------------------------------
+
+This file contains code for running compiled Parser plans over NumPy arrays of
+epochs, MomentArray, a column of moments stored as one such array, and
+DurationArray, a column of durations stored as int64 nanoseconds. Each
+plan step is carried out with array arithmetic: floors and weekday moves are
+integer operations on the epochs, the calendar fields come from the integer
+civil calendar conversion that moment.floor() uses too (nldt._civil_from_days()
+and nldt._days_from_civil()), and anything that has to ask the time module
+(local UTC offsets, the epoch of Jan 1 in the default timezone) is computed
+once per distinct day or year and then looked up.
+
+NumPy is optional. It is only needed when these functions are called.
+"""
+try:
+    import numpy as np
+except ImportError:                                     # pragma: no cover
+    np = None
+import calendar
+import nldt
+from nldt.text import txt
+import numbers
+import time
+
+DAY = 24 * 3600
+NS = 1000000000
+_TWO = None if np is None else np.array(['{:02d}'.format(num)
+                                         for num in range(100)])
+
+
+# -----------------------------------------------------------------------------
+class DurationArray(object):
+    """
+    A column of durations kept as an int64 NumPy array of nanoseconds (the ns
+    attribute), like the ns slot of a duration. That covers intervals of up
+    to 292 years either way. The methods are vector versions of what duration
+    does one value at a time: arithmetic, comparisons, dhms(), hms(), and
+    formatting by calling the array with a duration format. sum(), mean(),
+    min(), max(), median(), and percentile() reduce the column to one
+    duration.
+
+    Indexing with an int gives a duration; slices and masks give
+    DurationArrays. Comparisons give bool arrays. Adding a MomentArray gives
+    a MomentArray. to_bytes() and from_buffer() work as they do for
+    MomentArray.
+
+    Example:
+        >>> waits = nldt.DurationArray([90, 3725, 86461])
+        >>> waits.dhms()
+        array(['0.00:01:30', '0.01:02:05', '1.00:01:01'], dtype='<U10')
+        >>> waits.percentile(50)
+        nldt.duration(seconds=3725)
+    """
+    __array_ufunc__ = None
+    __hash__ = None
+
+    # -------------------------------------------------------------------------
+    def __init__(self, values=()):
+        """
+        *values* is a DurationArray, an array-like of seconds (fractions are
+        kept to the nanosecond), or an iterable of durations (class
+        DurationArray)
+        """
+        if np is None:
+            raise ImportError(txt['no-numpy'])
+        if isinstance(values, DurationArray):
+            self.ns = values.ns.copy()
+            return
+        values = np.ravel(np.asarray(values))
+        if values.dtype.kind in 'biu':
+            self.ns = values.astype(np.int64) * NS
+        elif values.dtype.kind == 'f':
+            self.ns = np.round(values * NS).astype(np.int64)
+        else:
+            self.ns = np.array([nldt.duration._from_seconds(item).ns
+                                if isinstance(item, numbers.Number)
+                                else item.ns for item in values],
+                               dtype=np.int64)
+
+    # -------------------------------------------------------------------------
+    def __abs__(self):
+        """
+        Element-wise absolute value (class DurationArray)
+        """
+        return DurationArray.from_ns(np.abs(self.ns))
+
+    # -------------------------------------------------------------------------
+    def __add__(self, other):
+        """
+        DurationArray + DurationArray, duration, or seconds => DurationArray
+        DurationArray + MomentArray or moment => MomentArray
+        (class DurationArray)
+        """
+        if isinstance(other, MomentArray):
+            return other + self
+        elif isinstance(other, nldt.moment):
+            return MomentArray._from_epochs((other.ns + self.ns) // NS)
+        other = _nanoseconds(other)
+        if other is None:
+            return NotImplemented
+        return DurationArray.from_ns(self.ns + other)
+
+    __radd__ = __add__
+
+    # -------------------------------------------------------------------------
+    def __array__(self, dtype=None, copy=None):
+        """
+        Lets NumPy see the nanoseconds, as in np.asarray(darr) (class
+        DurationArray)
+        """
+        if dtype is None:
+            return self.ns
+        return self.ns.astype(dtype)
+
+    # -------------------------------------------------------------------------
+    def __call__(self, fmtstr):
+        """
+        Vector version of duration(*fmtstr*): %Y, %d, %H, %M, and %S are
+        filled in for each element (class DurationArray)
+        """
+        parts = self._deconstruct()
+        rval = np.full(self.ns.shape, '', dtype=str)
+        for spec in nldt._STRFTIME.findall(fmtstr):
+            if spec == '%Y' or spec == '%d':
+                spec = _lookup(parts[spec[1]], str)
+            elif spec in ['%H', '%M', '%S']:
+                spec = _lookup(parts[spec[1]], '{:02d}'.format)
+            rval = np.char.add(rval, spec)
+        return rval
+
+    # -------------------------------------------------------------------------
+    def __eq__(self, other):
+        """
+        Element-wise *self* == *other* (class DurationArray)
+        """
+        return self.ns == _nanoseconds(other)
+
+    # -------------------------------------------------------------------------
+    def __ge__(self, other):
+        """
+        Element-wise *self* >= *other* (class DurationArray)
+        """
+        return self.ns >= _nanoseconds(other)
+
+    # -------------------------------------------------------------------------
+    def __getitem__(self, index):
+        """
+        An int *index* gives a duration; anything else gives a DurationArray
+        (class DurationArray)
+        """
+        rval = self.ns[index]
+        if np.ndim(rval) == 0:
+            return nldt.duration._from_ns(int(rval))
+        return DurationArray.from_ns(rval)
+
+    # -------------------------------------------------------------------------
+    def __gt__(self, other):
+        """
+        Element-wise *self* > *other* (class DurationArray)
+        """
+        return self.ns > _nanoseconds(other)
+
+    # -------------------------------------------------------------------------
+    def __iter__(self):
+        """
+        Yields a duration for each element (class DurationArray)
+        """
+        for count in self.ns.tolist():
+            yield nldt.duration._from_ns(count)
+
+    # -------------------------------------------------------------------------
+    def __le__(self, other):
+        """
+        Element-wise *self* <= *other* (class DurationArray)
+        """
+        return self.ns <= _nanoseconds(other)
+
+    # -------------------------------------------------------------------------
+    def __len__(self):
+        """
+        The number of elements (class DurationArray)
+        """
+        return len(self.ns)
+
+    # -------------------------------------------------------------------------
+    def __lt__(self, other):
+        """
+        Element-wise *self* < *other* (class DurationArray)
+        """
+        return self.ns < _nanoseconds(other)
+
+    # -------------------------------------------------------------------------
+    def __mul__(self, other):
+        """
+        DurationArray * number or array of numbers => DurationArray (class
+        DurationArray)
+        """
+        other = np.asarray(other)
+        if other.dtype.kind in 'biu':
+            return DurationArray.from_ns(self.ns * other.astype(np.int64))
+        elif other.dtype.kind == 'f':
+            return DurationArray.from_ns(np.round(self.ns * other)
+                                         .astype(np.int64))
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    # -------------------------------------------------------------------------
+    def __ne__(self, other):
+        """
+        Element-wise *self* != *other* (class DurationArray)
+        """
+        return self.ns != _nanoseconds(other)
+
+    # -------------------------------------------------------------------------
+    def __neg__(self):
+        """
+        Element-wise negation (class DurationArray)
+        """
+        return DurationArray.from_ns(-self.ns)
+
+    # -------------------------------------------------------------------------
+    def __reduce__(self):
+        """
+        Pickles the column as its array of nanoseconds rather than an instance
+        dict (class DurationArray)
+        """
+        return (type(self).from_ns, (self.ns,))
+
+    # -------------------------------------------------------------------------
+    def __repr__(self):
+        """
+        Returns a string that will regenerate this object if passed to eval()
+        with array imported from numpy (class DurationArray)
+        """
+        return "nldt.DurationArray.from_ns({!r})".format(self.ns)
+
+    # -------------------------------------------------------------------------
+    def __rsub__(self, other):
+        """
+        duration or seconds - DurationArray => DurationArray
+        moment - DurationArray => MomentArray
+        (class DurationArray)
+        """
+        if isinstance(other, nldt.moment):
+            return MomentArray._from_epochs((other.ns - self.ns) // NS)
+        other = _nanoseconds(other)
+        if other is None:
+            return NotImplemented
+        return DurationArray.from_ns(other - self.ns)
+
+    # -------------------------------------------------------------------------
+    def __sub__(self, other):
+        """
+        DurationArray - DurationArray, duration, or seconds => DurationArray
+        (class DurationArray)
+        """
+        if isinstance(other, (MomentArray, nldt.moment)):
+            raise TypeError(txt['optypes-01'])
+        other = _nanoseconds(other)
+        if other is None:
+            return NotImplemented
+        return DurationArray.from_ns(self.ns - other)
+
+    # -------------------------------------------------------------------------
+    def _deconstruct(self):
+        """
+        Vector version of duration._deconstruct(): splits the whole seconds
+        of each element into years, days, hours, minutes, and seconds, each
+        rounded toward zero as the scalar version does (class DurationArray)
+        """
+        rval = {}
+        secs = _trunc_div(self.ns, NS)
+        for key, size in [('Y', 365 * DAY), ('d', DAY), ('H', 3600),
+                          ('M', 60)]:
+            rval[key] = _trunc_div(secs, size)
+            secs = secs - rval[key] * size
+        rval['S'] = secs
+        return rval
+
+    # -------------------------------------------------------------------------
+    def dhms(self):
+        """
+        Vector version of duration.dhms(): <days>.HH:MM:SS for each element
+        (class DurationArray)
+        """
+        secs = _trunc_div(self.ns, NS)
+        days = _trunc_div(secs, DAY)
+        return np.char.add(_lookup(days, str),
+                           _lookup(secs - days * DAY, _day_clock))
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_buffer(cls, buffer, count=-1, offset=0):
+        """
+        Returns a DurationArray over the nanosecond counts in *buffer*, stored
+        as to_bytes() writes them. *buffer* may be anything with the buffer
+        protocol: bytes, bytearray, mmap, memoryview, shared memory. *count*
+        and *offset* (in bytes) pick out part of it, as for np.frombuffer().
+        The array shares memory with *buffer*, and so is read-only if *buffer*
+        is. (class DurationArray)
+        """
+        return cls.from_ns(_records(buffer, count, offset))
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_ns(cls, counts):
+        """
+        Returns a DurationArray over the int64 nanosecond counts in *counts*
+        (class DurationArray)
+        """
+        rval = object.__new__(cls)
+        rval.ns = np.asarray(counts, dtype=np.int64)
+        return rval
+
+    # -------------------------------------------------------------------------
+    def hms(self):
+        """
+        Vector version of duration.hms(): HH:MM:SS for each element, with a
+        leading '-' for negative durations (class DurationArray)
+        """
+        secs = np.abs(_trunc_div(self.ns, NS))
+        rval = np.char.add(_lookup(secs // 3600, '{:02d}'.format),
+                           _lookup(secs % 3600, lambda sec: ":{:02d}:{:02d}"
+                                   .format(sec // 60, sec % 60)))
+        return np.where(self.ns < 0, np.char.add('-', rval), rval)
+
+    # -------------------------------------------------------------------------
+    def max(self):
+        """
+        The longest duration (class DurationArray)
+        """
+        if not self.ns.size:
+            raise ValueError(txt['no-durations'].format('max'))
+        return nldt.duration._from_ns(int(self.ns.max()))
+
+    # -------------------------------------------------------------------------
+    def mean(self):
+        """
+        The mean duration, to the nearest nanosecond (class DurationArray)
+        """
+        if not self.ns.size:
+            raise ValueError(txt['no-durations'].format('mean'))
+        return nldt.duration._from_ns(_rounded(self._total(), len(self.ns)))
+
+    # -------------------------------------------------------------------------
+    def median(self):
+        """
+        The median duration (class DurationArray)
+        """
+        return self.percentile(50)
+
+    # -------------------------------------------------------------------------
+    def min(self):
+        """
+        The shortest duration (class DurationArray)
+        """
+        if not self.ns.size:
+            raise ValueError(txt['no-durations'].format('min'))
+        return nldt.duration._from_ns(int(self.ns.min()))
+
+    # -------------------------------------------------------------------------
+    def percentile(self, q):
+        """
+        The *q*th percentile (0 - 100) of the durations, interpolated
+        linearly between neighbours as np.percentile() does by default and
+        rounded to the nanosecond. The neighbours come from np.partition(),
+        and the interpolation is done on their difference, so a percentile
+        that falls on an element is that element exactly. If *q* is a
+        sequence, the result is a DurationArray with one element per value.
+        (class DurationArray)
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if (q < 0).any() or (100 < q).any():
+            raise ValueError(txt['percentile'])
+        if not self.ns.size:
+            raise ValueError(txt['no-durations'].format('percentile'))
+        pos = q / 100 * (len(self.ns) - 1)
+        low = np.floor(pos).astype(np.int64)
+        high = np.minimum(low + 1, len(self.ns) - 1)
+        ordered = np.partition(self.ns, np.unique(np.append(low, high)))
+        rval = ordered[low] + np.round((ordered[high] - ordered[low]) *
+                                       (pos - low)).astype(np.int64)
+        if np.ndim(rval) == 0:
+            return nldt.duration._from_ns(int(rval))
+        return DurationArray.from_ns(rval)
+
+    # -------------------------------------------------------------------------
+    def seconds(self):
+        """
+        The length of each element in seconds, as a float64 array (class
+        DurationArray)
+        """
+        return self.ns / NS
+
+    # -------------------------------------------------------------------------
+    def sum(self):
+        """
+        The total of the durations (class DurationArray)
+        """
+        return nldt.duration._from_ns(self._total())
+
+    # -------------------------------------------------------------------------
+    def to_bytes(self):
+        """
+        Returns the nanosecond counts as little-endian int64 records, eight
+        bytes a row (class DurationArray)
+        """
+        return self.ns.astype('<i8', copy=False).tobytes()
+
+    # -------------------------------------------------------------------------
+    def _total(self):
+        """
+        The exact sum of the nanosecond counts as a Python int. The whole
+        seconds and the nanoseconds left over are summed separately, so tens
+        of millions of long durations do not overflow int64. (class
+        DurationArray)
+        """
+        secs, frac = np.divmod(self.ns, NS)
+        return int(secs.sum()) * NS + int(frac.sum())
+
+
+# -----------------------------------------------------------------------------
+class MomentArray(object):
+    """
+    A column of moments kept as an int64 NumPy array of UTC epochs (the
+    epochs attribute), eight bytes a row. The methods are vector versions of
+    what moment does one value at a time: arithmetic with durations and
+    seconds, floor() and ceiling(), the calendar fields, comparisons, and
+    formatting by calling the array with a strftime format.
+
+    Indexing with an int gives a moment; slices and masks give MomentArrays.
+    Comparisons give bool arrays. Subtracting two MomentArrays gives a
+    DurationArray. to_bytes() writes the epochs as raw int64 records and
+    from_buffer() wraps such records where they lie, without copying.
+
+    Example:
+        >>> days = nldt.MomentArray([1539702123, 1540393323])
+        >>> days.floor('week')('%F', otz='utc')
+        array(['2018-10-15', '2018-10-22'], dtype='<U10')
+    """
+    __array_ufunc__ = None
+    __hash__ = None
+
+    # -------------------------------------------------------------------------
+    def __init__(self, values=()):
+        """
+        *values* is a MomentArray, an array-like of epoch numbers (fractions
+        are dropped, as moment() drops them), or an iterable of anything
+        moment() accepts: moments, epochs, or date/time strings read in the
+        default timezone. (class MomentArray)
+        """
+        if np is None:
+            raise ImportError(txt['no-numpy'])
+        if isinstance(values, MomentArray):
+            self.epochs = values.epochs.copy()
+            return
+        values = np.ravel(np.asarray(values))
+        if values.dtype.kind in 'biuf':
+            self.epochs = values.astype(np.int64)
+        else:
+            self.epochs = np.array([nldt.moment(item).epoch()
+                                    for item in values], dtype=np.int64)
+
+    # -------------------------------------------------------------------------
+    def __add__(self, other):
+        """
+        MomentArray + duration, DurationArray, seconds, or an array of
+        seconds => MomentArray. Fractions of a second are dropped. (class
+        MomentArray)
+        """
+        if isinstance(other, (MomentArray, nldt.moment)):
+            raise TypeError(txt['mom-sum'])
+        secs = _seconds(other)
+        if secs is None:
+            return NotImplemented
+        return MomentArray._from_epochs(self.epochs + secs)
+
+    __radd__ = __add__
+
+    # -------------------------------------------------------------------------
+    def __array__(self, dtype=None, copy=None):
+        """
+        Lets NumPy see the epochs, as in np.asarray(marr) (class MomentArray)
+        """
+        if dtype is None:
+            return self.epochs
+        return self.epochs.astype(dtype)
+
+    # -------------------------------------------------------------------------
+    def __call__(self, fmt=None, otz=None):
+        """
+        Returns an array of strings, one per element, like moment(*fmt*,
+        *otz*) gives for one. The fields are built column by column, so each
+        directive costs a few array operations for the whole column rather
+        than a time.strftime() call per row. %f and %N are all zeros. Less
+        common directives (%c, %U, and so on) fall back to time.strftime()
+        once per distinct value. (class MomentArray)
+        """
+        fmt = fmt or "%Y-%m-%d"
+        otz = otz or 'local'
+        specs = [nldt._STRFTIME_SPELLED.get(spec, spec)
+                 for spec in nldt._STRFTIME.findall(fmt)]
+        specs = nldt._STRFTIME.findall(''.join(specs))
+        offsets, names = _zone_columns(self.epochs, otz,
+                                       names='%Z' in specs)
+        local = self.epochs + offsets
+        days = local // DAY
+        cols = {}
+        rval = np.full(self.epochs.shape, '', dtype=str)
+        for spec in specs:
+            if len(spec) == 2 and spec[0] == '%':
+                piece = _format_field(spec, local, days, offsets, names, cols)
+            else:
+                piece = spec
+            rval = np.char.add(rval, piece)
+        return rval
+
+    # -------------------------------------------------------------------------
+    def __eq__(self, other):
+        """
+        Element-wise *self* == *other* (class MomentArray)
+        """
+        return self.epochs == _operand(other)
+
+    # -------------------------------------------------------------------------
+    def __ge__(self, other):
+        """
+        Element-wise *self* >= *other* (class MomentArray)
+        """
+        return self.epochs >= _operand(other)
+
+    # -------------------------------------------------------------------------
+    def __getitem__(self, index):
+        """
+        An int *index* gives a moment; anything else gives a MomentArray
+        (class MomentArray)
+        """
+        rval = self.epochs[index]
+        if np.ndim(rval) == 0:
+            return nldt.moment._from_epoch(int(rval))
+        return MomentArray._from_epochs(rval)
+
+    # -------------------------------------------------------------------------
+    def __gt__(self, other):
+        """
+        Element-wise *self* > *other* (class MomentArray)
+        """
+        return self.epochs > _operand(other)
+
+    # -------------------------------------------------------------------------
+    def __iter__(self):
+        """
+        Yields a moment for each element (class MomentArray)
+        """
+        for epoch in self.epochs.tolist():
+            yield nldt.moment._from_epoch(epoch)
+
+    # -------------------------------------------------------------------------
+    def __le__(self, other):
+        """
+        Element-wise *self* <= *other* (class MomentArray)
+        """
+        return self.epochs <= _operand(other)
+
+    # -------------------------------------------------------------------------
+    def __len__(self):
+        """
+        The number of elements (class MomentArray)
+        """
+        return len(self.epochs)
+
+    # -------------------------------------------------------------------------
+    def __lt__(self, other):
+        """
+        Element-wise *self* < *other* (class MomentArray)
+        """
+        return self.epochs < _operand(other)
+
+    # -------------------------------------------------------------------------
+    def __ne__(self, other):
+        """
+        Element-wise *self* != *other* (class MomentArray)
+        """
+        return self.epochs != _operand(other)
+
+    # -------------------------------------------------------------------------
+    def __reduce__(self):
+        """
+        Pickles the column as its array of epochs rather than an instance dict
+        (class MomentArray)
+        """
+        return (type(self)._from_epochs, (self.epochs,))
+
+    # -------------------------------------------------------------------------
+    def __repr__(self):
+        """
+        Returns a string that will regenerate this object if passed to eval()
+        with array imported from numpy (class MomentArray)
+        """
+        return "nldt.MomentArray({!r})".format(self.epochs)
+
+    # -------------------------------------------------------------------------
+    def __rsub__(self, other):
+        """
+        moment - MomentArray => DurationArray (class MomentArray)
+        """
+        if isinstance(other, nldt.moment):
+            return DurationArray.from_ns((other.epoch() - self.epochs) * NS)
+        return NotImplemented
+
+    # -------------------------------------------------------------------------
+    def __sub__(self, other):
+        """
+        MomentArray - MomentArray or moment => DurationArray
+        MomentArray - duration, DurationArray, seconds, or array of seconds
+        => MomentArray
+        (class MomentArray)
+        """
+        if isinstance(other, (MomentArray, nldt.moment)):
+            return DurationArray.from_ns((self.epochs - _operand(other)) * NS)
+        secs = _seconds(other)
+        if secs is None:
+            return NotImplemented
+        return MomentArray._from_epochs(self.epochs - secs)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def _from_epochs(cls, epochs):
+        """
+        Wraps the int64 array *epochs* without copying or checking it. For
+        internal use, where *epochs* is already known to be right. (class
+        MomentArray)
+        """
+        rval = object.__new__(cls)
+        rval.epochs = epochs
+        return rval
+
+    # -------------------------------------------------------------------------
+    def ceiling(self, unit, start=None):
+        """
+        Vector version of moment.ceiling(): the last second of the *unit*
+        containing each element, in UTC (class MomentArray)
+        """
+        first = nldt._week_first(unit, start)
+        if unit == 'second':
+            return MomentArray._from_epochs(self.epochs.copy())
+        rval = nldt._floor_epoch(self.epochs, unit, 1, first) - 1
+        return MomentArray._from_epochs(rval)
+
+    # -------------------------------------------------------------------------
+    def day_number(self, count=None, tz=None):
+        """
+        Vector version of week.day_number(): the weekday of each element,
+        counted as *count* says ('mon0', the default, 'mon1' or '%u', 'sun0'
+        or '%w'), in zone *tz* (default UTC) (class MomentArray)
+        """
+        wday = (self._local(tz) // DAY + 3) % 7
+        count = count or 'mon0'
+        if count in ['mon1', '%u']:
+            return wday + 1
+        elif count in ['sun0', '%w']:
+            return (wday + 1) % 7
+        return wday
+
+    # -------------------------------------------------------------------------
+    def epoch(self):
+        """
+        Returns the epochs as an int64 array (class MomentArray)
+        """
+        return self.epochs
+
+    # -------------------------------------------------------------------------
+    def floor(self, unit, start=None):
+        """
+        Vector version of moment.floor(): the first second of the *unit*
+        containing each element, in UTC (class MomentArray)
+        """
+        first = nldt._week_first(unit, start)
+        rval = nldt._floor_epoch(self.epochs, unit, 0, first)
+        return MomentArray._from_epochs(rval)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_buffer(cls, buffer, count=-1, offset=0):
+        """
+        Returns a MomentArray over the epochs in *buffer*, stored as
+        to_bytes() writes them, without copying them. See
+        DurationArray.from_buffer(). An array.array('q') of epochs, such as
+        nldt.bulk.parse() returns, can be read this way too. (class
+        MomentArray)
+        """
+        return cls._from_epochs(_records(buffer, count, offset))
+
+    # -------------------------------------------------------------------------
+    def hour(self, tz=None):
+        """
+        The hour (0 - 23) of each element in zone *tz* (default UTC) (class
+        MomentArray)
+        """
+        return self._local(tz) % DAY // 3600
+
+    # -------------------------------------------------------------------------
+    def _local(self, tz):
+        """
+        The epochs shifted by the UTC offset of zone *tz* at each one, so
+        that UTC arithmetic on them gives the wall clock fields in *tz*
+        (class MomentArray)
+        """
+        return self.epochs + _zone_columns(self.epochs, tz or 'utc')[0]
+
+    # -------------------------------------------------------------------------
+    def mday(self, tz=None):
+        """
+        The day of the month (1 - 31) of each element in zone *tz* (default
+        UTC) (class MomentArray)
+        """
+        return nldt._civil_from_days(self._local(tz) // DAY)[2]
+
+    # -------------------------------------------------------------------------
+    def minute(self, tz=None):
+        """
+        The minute (0 - 59) of each element in zone *tz* (default UTC) (class
+        MomentArray)
+        """
+        return self._local(tz) % 3600 // 60
+
+    # -------------------------------------------------------------------------
+    def month(self, tz=None):
+        """
+        The month (1 - 12) of each element in zone *tz* (default UTC) (class
+        MomentArray)
+        """
+        return nldt._civil_from_days(self._local(tz) // DAY)[1]
+
+    # -------------------------------------------------------------------------
+    def second(self, tz=None):
+        """
+        The second (0 - 59) of each element (class MomentArray)
+        """
+        return self._local(tz) % 60
+
+    # -------------------------------------------------------------------------
+    def to_bytes(self):
+        """
+        Returns the epochs as little-endian int64 records, eight bytes a row
+        (class MomentArray)
+        """
+        return self.epochs.astype('<i8', copy=False).tobytes()
+
+    # -------------------------------------------------------------------------
+    def wday(self, tz=None):
+        """
+        The weekday of each element, mon = 0, as in tm_wday, in zone *tz*
+        (default UTC) (class MomentArray)
+        """
+        return self.day_number('mon0', tz)
+
+    # -------------------------------------------------------------------------
+    def yday(self, tz=None):
+        """
+        The day of the year (1 - 366) of each element in zone *tz* (default
+        UTC), as in tm_yday (class MomentArray)
+        """
+        days = self._local(tz) // DAY
+        year = nldt._civil_from_days(days)[0]
+        return days - nldt._days_from_civil(year, 1, 1) + 1
+
+    # -------------------------------------------------------------------------
+    def year(self, tz=None):
+        """
+        The year of each element in zone *tz* (default UTC) (class
+        MomentArray)
+        """
+        return nldt._civil_from_days(self._local(tz) // DAY)[0]
+
+
+# -----------------------------------------------------------------------------
+def _day_clock(secs):
+    """
+    The '.HH:MM:SS' tail of duration.dhms() for the *secs* (-86399 - 86399)
+    left over after the days, with the same rounding toward zero
+    """
+    hours = int(secs / 3600)
+    minutes = int((secs - hours * 3600) / 60)
+    return ".{:02d}:{:02d}:{:02d}".format(hours, minutes,
+                                          secs - hours * 3600 - minutes * 60)
+
+
+# -----------------------------------------------------------------------------
+def evaluate(plan, epochs):
+    """
+    Runs the steps of *plan* (an nldt.Plan) over *epochs*, an array-like of
+    epoch times, and returns an int64 array with the result for each one. For
+    every element, the result is the same as plan(epoch).epoch().
+
+    Example:
+        >>> prs = nldt.Parser()
+        >>> evaluate(prs.compile('last week'), [1539702123, 1540393323])
+        array([1538956800, 1539561600])
+    """
+    if np is None:
+        raise ImportError(txt['no-numpy'])
+    epochs = np.asarray(epochs).astype(np.int64)
+    if epochs.size == 0:
+        return epochs
+    for step in plan.steps:
+        epochs = _step(epochs, step)
+    return epochs
+
+
+# -----------------------------------------------------------------------------
+def local_offsets(epochs):
+    """
+    Returns the local UTC offset in seconds (time.localtime().tm_gmtoff) for
+    each element of *epochs*. Offsets are looked up at the beginning and end of
+    each distinct UTC day. On the few days where those differ, the second of
+    the transition is found by bisection and the elements of that day are
+    split around it.
+    """
+    def offset(epoch):
+        return time.localtime(epoch).tm_gmtoff
+
+    days = epochs // DAY
+    first = _tabulate(days, lambda d: offset(d * DAY))
+    last = _tabulate(days, lambda d: offset(d * DAY + DAY - 1))
+    rval = first
+    changed = first != last
+    if changed.any():
+        rval = first.copy()
+        for day in np.unique(days[changed]):
+            low, high = int(day) * DAY, int(day) * DAY + DAY - 1
+            before, after = offset(low), offset(high)
+            while high - low > 1:
+                mid = (low + high) // 2
+                if offset(mid) == before:
+                    low = mid
+                else:
+                    high = mid
+            where = days == day
+            rval[where] = np.where(epochs[where] < high, before, after)
+    return rval
+
+
+# -----------------------------------------------------------------------------
+def _lookup(keys, func):
+    """
+    Returns an array holding func(key) for each element of the int array
+    *keys*, calling *func* once per distinct key (or per key in the range,
+    when the keys are dense). Like _tabulate(), but for values of any type,
+    such as the strings of one strftime field.
+    """
+    keys = np.asarray(keys)
+    if keys.size == 0:
+        return np.array([], dtype=str)
+    low, high = int(keys.min()), int(keys.max())
+    if high - low <= keys.size:
+        table = np.array([func(key) for key in range(low, high + 1)])
+        return table[keys - low]
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    table = np.array([func(int(key)) for key in uniq])
+    return table[inverse.reshape(keys.shape)]
+
+
+# -----------------------------------------------------------------------------
+def _nanoseconds(other):
+    """
+    Returns *other* (a DurationArray, a duration, a number of seconds, or an
+    array of them) as nanoseconds to combine with the ns of a DurationArray,
+    or None if it is none of those
+    """
+    if isinstance(other, DurationArray):
+        return other.ns
+    elif isinstance(other, nldt.duration):
+        return other.ns
+    elif isinstance(other, numbers.Number):
+        return nldt._ns(other)
+    other = np.asarray(other)
+    if other.dtype.kind in 'biu':
+        return other.astype(np.int64) * NS
+    elif other.dtype.kind == 'f':
+        return np.round(other * NS).astype(np.int64)
+    return None
+
+
+# -----------------------------------------------------------------------------
+def _operand(other):
+    """
+    Returns what the epochs of a MomentArray are compared with for *other*:
+    the epochs of a MomentArray, the epoch of a moment or of a date/time
+    string, or *other* itself (a number or an array of numbers)
+    """
+    if isinstance(other, MomentArray):
+        return other.epochs
+    elif isinstance(other, nldt.moment):
+        return other.epoch()
+    elif isinstance(other, str):
+        return nldt.moment(other).epoch()
+    return other
+
+
+# -----------------------------------------------------------------------------
+def _records(buffer, count, offset):
+    """
+    Reads the little-endian int64 records in *buffer* as a native int64
+    array. On a little-endian machine that is a view of *buffer*; elsewhere
+    the bytes have to be swapped into a copy.
+    """
+    rval = np.frombuffer(buffer, dtype='<i8', count=count, offset=offset)
+    return rval.astype(np.int64, copy=False)
+
+
+# -----------------------------------------------------------------------------
+def _rounded(total, count):
+    """
+    *total* / *count* rounded to the nearest int, halves away from zero, in
+    integer arithmetic
+    """
+    quot, rem = divmod(abs(total), count)
+    quot += 2 * rem >= count
+    return -quot if total < 0 else quot
+
+
+# -----------------------------------------------------------------------------
+def _seconds(other):
+    """
+    Returns *other* (a duration, a DurationArray, a number of seconds, or an
+    array of numbers) as whole seconds to add to epochs, or None if it is none
+    of those
+    """
+    if isinstance(other, nldt.duration):
+        return other.ns // NS
+    elif isinstance(other, DurationArray):
+        return other.ns // NS
+    elif isinstance(other, numbers.Number):
+        return int(other)
+    other = np.asarray(other)
+    if other.dtype.kind in 'biuf':
+        return other.astype(np.int64)
+    return None
+
+
+# -----------------------------------------------------------------------------
+def _step(epochs, step):
+    """
+    Vector version of Plan.step(): applies one *step* to each of *epochs*
+    """
+    op = step[0]
+    if op == 'shift':
+        rval = epochs + step[1]
+    elif op == 'floor':
+        rval = nldt._floor_epoch(epochs, step[1], step[2])
+    elif op == 'ceiling':
+        if step[1] == 'second':
+            rval = epochs
+        else:
+            rval = nldt._floor_epoch(epochs, step[1], 1) - 1
+    elif op == 'on_or_after':
+        wday = (epochs // DAY + 3) % 7
+        rval = epochs + ((step[1] - wday) % 7) * DAY
+    elif op in ['next_wday', 'last_wday']:
+        wday = ((epochs + local_offsets(epochs)) // DAY + 3) % 7
+        if op == 'next_wday':
+            rval = epochs + ((step[1] - wday - 1) % 7 + 1) * DAY
+        else:
+            rval = epochs - ((wday - step[1] - 1) % 7 + 1) * DAY
+    elif op == 'year':
+        local = (epochs + local_offsets(epochs)) // DAY
+        year = nldt._civil_from_days(local)[0] + step[1]
+        rval = _tabulate(year, lambda y: _jan1(y, 1))
+    elif op == 'month_of':
+        year = nldt._civil_from_days(epochs // DAY)[0]
+        rval = _tabulate(year, lambda y: _jan1(y, step[1]))
+    else:
+        raise ValueError(txt['plan-step'].format(step))
+    return rval
+
+
+# -----------------------------------------------------------------------------
+def _format_field(spec, local, days, offsets, names, cols):
+    """
+    Returns the strings (an array, or one string for the whole column) that
+    the strftime directive *spec* gives for each of the wall clock epochs
+    *local*. *days* is local // DAY. *offsets* and *names* are the UTC offsets
+    and zone names from _zone_columns(). *cols* caches the calendar fields
+    between directives of one format.
+    """
+    if 'ymd' not in cols:
+        cols['ymd'] = nldt._civil_from_days(days)
+    year, mon, mday = cols['ymd']
+    wday = (days + 3) % 7
+    if spec == '%Y':
+        return _lookup(year, str)
+    elif spec == '%m':
+        return _TWO[mon]
+    elif spec == '%d':
+        return _TWO[mday]
+    elif spec == '%e':
+        return _lookup(mday, '{:2d}'.format)
+    elif spec == '%H':
+        return _TWO[local % DAY // 3600]
+    elif spec == '%M':
+        return _TWO[local % 3600 // 60]
+    elif spec == '%S':
+        return _TWO[local % 60]
+    elif spec == '%y':
+        return _TWO[year % 100]
+    elif spec == '%j':
+        return _lookup(days - nldt._days_from_civil(year, 1, 1) + 1,
+                       '{:03d}'.format)
+    elif spec == '%I':
+        return _TWO[(local % DAY // 3600 + 11) % 12 + 1]
+    elif spec == '%p':
+        ampm = [time.strftime('%p', (2000, 1, 1, hour, 0, 0, 5, 1, 0))
+                for hour in (0, 12)]
+        return np.array(ampm)[local % DAY // 43200]
+    elif spec == '%a':
+        return np.array(list(calendar.day_abbr))[wday]
+    elif spec == '%A':
+        return np.array(list(calendar.day_name))[wday]
+    elif spec in ['%b', '%h']:
+        return np.array(list(calendar.month_abbr))[mon]
+    elif spec == '%B':
+        return np.array(list(calendar.month_name))[mon]
+    elif spec == '%u':
+        return (wday + 1).astype(str)
+    elif spec == '%w':
+        return ((wday + 1) % 7).astype(str)
+    elif spec == '%z':
+        return _lookup(offsets, lambda off: "{}{:02d}{:02d}".format(
+            '-' if off < 0 else '+', abs(off) // 3600, abs(off) % 3600 // 60))
+    elif spec == '%Z':
+        return names
+    elif spec == '%f':
+        return '000000'
+    elif spec == '%N':
+        return '000000000'
+    elif spec == '%%':
+        return '%'
+    return _lookup(local, lambda epoch: time.strftime(spec,
+                                                      time.gmtime(epoch)))
+
+
+# -----------------------------------------------------------------------------
+def _jan1(year, mon):
+    """
+    Epoch of the first of *mon* in *year* in the default timezone, as the
+    'year' and 'month_of' plan steps compute it
+    """
+    return nldt.moment((year, mon, 1, 0, 0, 0, 0, 0, 0)).epoch()
+
+
+# -----------------------------------------------------------------------------
+def _tabulate(keys, func):
+    """
+    Returns an int64 array holding func(key) for each element of *keys*,
+    calling *func* once per distinct key. When the keys are dense (days or
+    years spanned by the data), the table covers the whole range and is
+    indexed directly; otherwise it is built over np.unique(keys).
+    """
+    low, high = int(keys.min()), int(keys.max())
+    if high - low <= keys.size:
+        table = np.array([func(key) for key in range(low, high + 1)],
+                         dtype=np.int64)
+        return table[keys - low]
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    table = np.array([func(int(key)) for key in uniq], dtype=np.int64)
+    return table[inverse.reshape(keys.shape)]
+
+
+# -----------------------------------------------------------------------------
+def _trunc_div(values, size):
+    """
+    Element-wise int(values / size), rounding toward zero as the scalar
+    duration methods do, where // would round toward minus infinity
+    """
+    quot = np.abs(values) // size
+    return np.where(values < 0, -quot, quot)
+
+
+# -----------------------------------------------------------------------------
+def _zone_columns(epochs, tz, names=False):
+    """
+    Returns (offsets, zone names) for each of *epochs* in zone *tz*, which
+    may be 'utc', 'local', or a zone name. The names are only worked out if
+    *names* is True; otherwise the second item is None. Named zones use the
+    transition table from nldt._zone_table(), searched for the whole array at
+    once; epochs past the table's end go through nldt._zone_info() once per
+    distinct value.
+    """
+    if tz.lower() == 'utc':
+        return (np.zeros_like(epochs), 'GMT' if names else None)
+    elif tz == 'local':
+        offsets = local_offsets(epochs) if epochs.size else epochs
+        if not names:
+            return (offsets, None)
+        # a name can change without the offset changing (EWT -> EPT), so
+        # names are looked up per distinct day and offset
+        keys = epochs // DAY * 262144 + offsets + 131072
+        uniq, first, inverse = np.unique(keys, return_index=True,
+                                         return_inverse=True)
+        table = np.array([time.localtime(int(epochs[idx])).tm_zone
+                          for idx in first] or [''])
+        return (offsets, table[inverse.reshape(epochs.shape)])
+    starts, infos = nldt._zone_table(tz)
+    idx = np.maximum(np.searchsorted(np.array(starts, dtype=np.int64), epochs,
+                                     side='right') - 1, 0)
+    if starts[-1] >= nldt._ZONE_HORIZON:
+        late = epochs >= starts[-1]
+        if late.any():
+            uniq, inverse = np.unique(epochs[late], return_inverse=True)
+            idx[late] = len(infos) + inverse
+            infos = infos + [nldt._zone_info(int(epoch), tz)
+                             for epoch in uniq]
+    offsets = np.array([info[0] for info in infos], dtype=np.int64)[idx]
+    if not names:
+        return (offsets, None)
+    return (offsets, np.array([info[2] for info in infos])[idx])
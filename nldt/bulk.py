@@ -0,0 +1,140 @@
+"""
+nldt - Natural Language Date/Time support
+Copyright (c) 2017 - <the end of time>  Tom Barron
+See file LICENSING for details
+-------------------------------------------------------------------------------
+
+This file contains code for resolving very large batches of expressions on
+several cores. The input is cut into chunks that are handed to a pool of
+worker processes. Each worker keeps one Parser for its whole life, so the
+lexicon and the plan and result caches stay warm from chunk to chunk. Workers
+do not send moments back. Each chunk has a slot in a shared memory block, and
+the worker writes the epochs straight into it as int64 values. The parent
+copies them out in input order.
+
+multiprocessing.shared_memory arrived in Python 3.8. It is only needed when
+parse() is called.
+"""
+import array
+import collections
+from concurrent import futures
+import itertools
+try:
+    from multiprocessing import shared_memory
+except ImportError:                                     # pragma: no cover
+    shared_memory = None
+import nldt
+from nldt.text import txt
+import os
+
+FAILED = -2 ** 63
+_FAILURES = (AttributeError, OverflowError, TypeError, ValueError,
+             nldt.ParseError)
+_parser = None
+
+
+# -----------------------------------------------------------------------------
+def parse(exprs, start=None, workers=None, chunk=10000, cache_size=4096):
+    """
+    Resolves each expression in *exprs* (a list or any iterable) against
+    *start* (default: now, read once for the whole run) and returns an
+    array.array('q') of epochs in input order. Expressions that cannot be
+    resolved get the value FAILED: those that are not understood, that are
+    not strings, or that land outside what the platform's time functions can
+    handle. Any other exception in a worker is raised here.
+
+    *workers* is the number of processes (default: os.cpu_count()). At most
+    two chunks of *chunk* expressions per worker are in flight, so an
+    iterator is consumed a piece at a time. Each worker's Parser is made with
+    *cache_size* and reads dates in the caller's moment.default_tz(), so the
+    results do not depend on whether workers are forked or spawned.
+
+    Example:
+        >>> import nldt.bulk
+        >>> nldt.bulk.parse(['tomorrow', 'next week'] * 100000, workers=4)
+        array('q', [1539820800, 1539561600, ...])
+    """
+    if shared_memory is None:
+        raise ImportError(txt['no-shm'])
+    workers = workers or os.cpu_count() or 1
+    start = int((start or nldt.moment()).epoch())
+    deftz = getattr(nldt.moment, 'deftz', None)
+    exprs = iter(exprs)
+    chunks = iter(lambda: list(itertools.islice(exprs, chunk)), [])
+    rval = array.array('q')
+    slots = [shared_memory.SharedMemory(create=True, size=8 * chunk)
+             for _ in range(2 * workers)]
+    free = collections.deque(slots)
+    pending = collections.deque()
+    try:
+        with futures.ProcessPoolExecutor(workers, initializer=_init,
+                                         initargs=(cache_size, deftz)) as pool:
+            for exprl in chunks:
+                if not free:
+                    _collect(pending, free, rval)
+                slot = free.popleft()
+                pending.append((slot, pool.submit(_work, slot.name, exprl,
+                                                  start)))
+            while pending:
+                _collect(pending, free, rval)
+    finally:
+        for slot in slots:
+            slot.close()
+            slot.unlink()
+    return rval
+
+
+# -----------------------------------------------------------------------------
+def _collect(pending, free, rval):
+    """
+    Waits for the oldest chunk in *pending*, appends its epochs to *rval*,
+    and returns its slot to *free*
+    """
+    slot, future = pending.popleft()
+    count = future.result()
+    rval.frombytes(slot.buf[:8 * count])
+    free.append(slot)
+
+
+# -----------------------------------------------------------------------------
+def _init(cache_size, deftz):
+    """
+    Sets up the Parser this worker process will use for every chunk and the
+    parent's default timezone *deftz* (None if the parent never set one)
+    """
+    global _parser
+    if deftz is not None:
+        nldt.moment.default_tz(deftz)
+    _parser = nldt.Parser(cache_size=cache_size)
+
+
+# -----------------------------------------------------------------------------
+def _one(expr, anchor):
+    """
+    Returns the epoch for *expr*, or FAILED if it cannot be resolved or does
+    not fit in an int64
+    """
+    try:
+        rval = int(_parser(expr, anchor).epoch())
+    except _FAILURES:
+        return FAILED
+    return rval if FAILED < rval < 2 ** 63 else FAILED
+
+
+# -----------------------------------------------------------------------------
+def _work(name, exprs, start):
+    """
+    Resolves *exprs* against the epoch *start* and writes the epochs into the
+    shared memory block *name*. Returns the number of values written.
+    """
+    anchor = nldt.moment(start)
+    try:
+        epochs = _parser.parse_many(exprs, anchor, epochs=True)
+    except _FAILURES:
+        epochs = array.array('q', [_one(expr, anchor) for expr in exprs])
+    slot = shared_memory.SharedMemory(name=name)
+    try:
+        slot.buf[:8 * len(epochs)] = epochs.tobytes()
+    finally:
+        slot.close()
+    return len(epochs)
@@ -8,6 +8,9 @@ This file contains code for converting words describing numbers into the
 numbers described. For example, it will convert the string 'seventy-five' to
 the number 75.
 """
+ordinal_words = {'first': 1, 'second': 2, 'third': 3, 'fifth': 5,
+                 'eighth': 8, 'ninth': 9, 'twelfth': 12}
+ordinal_endings = [('ieth', 'y'), ('th', '')]
 
 
 # -----------------------------------------------------------------------------
@@ -71,10 +74,6 @@ def subscan(textnum, numwords=None):
             subscan._numwords = set_numwords()
             numwords = subscan._numwords
 
-    ordinal_words = {'first': 1, 'second': 2, 'third': 3, 'fifth': 5,
-                     'eighth': 8, 'ninth': 9, 'twelfth': 12}
-    ordinal_endings = [('ieth', 'y'), ('th', '')]
-
     textnum = textnum.replace('-', ' ')
 
     current = result = 0
@@ -131,6 +130,34 @@ def set_numwords():
     return numwords
 
 
+# -----------------------------------------------------------------------------
+def vocabulary():
+    """
+    Returns a frozenset of every single word that subscan() will take as part
+    of a number: the number words, their ordinal forms, and 'and'. Only real
+    ordinals are listed ('eighth', not 'eightth'), though subscan() would
+    take the regular form too.
+
+    Example:
+        >>> 'twentieth' in vocabulary()
+        True
+        >>> 'month' in vocabulary()
+        False
+    """
+    numwords = dict((word, val) for word, val in set_numwords().items()
+                    if word)
+    irregular = set(ordinal_words.values())
+    rval = set(numwords) | set(ordinal_words)
+    for word, (scale, increment) in numwords.items():
+        if word == 'and' or (scale == 1 and increment in irregular):
+            continue
+        for ending, replacement in ordinal_endings:
+            if word.endswith(replacement):
+                rval.add(word[:len(word) - len(replacement)] + ending)
+                break
+    return frozenset(rval)
+
+
 # -----------------------------------------------------------------------------
 def tokenize(text):
     """
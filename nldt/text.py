@@ -49,8 +49,13 @@ txt['mctor-001'] = "If start or end is specified, both must be"
 txt['mom-sum'] = "sum of moments is not defined"
 txt['nan'] = "not a number"
 txt['no-args'] = "moment() cannot take format or tz without date spec"
+txt['no-attr'] = "module '{}' has no attribute '{}'"
+txt['no-durations'] = "{}() needs at least one duration"
 txt['no-match'] = ("None of the common specifications match"
                    " the date/time string")
+txt['no-numpy'] = "NumPy is required for arrays of epochs"
+txt['no-shm'] = ("multiprocessing.shared_memory (Python 3.8+) is required "
+                 "for bulk parsing")
 txt['no-unit'] = "No unit found in expression '{}'"
 txt['not-indxfy'] = "Could not indexify '{}'"
 txt['not-empty'] = "result must be an empty list"
@@ -59,6 +64,9 @@ txt['optypes-01'] = "Unsupported operand types(s): try 'moment' - 'duration'"
 txt['optypes-02'] = "unsupported operand types(s): '{}' and '{}'"
 txt['parse-fail'] = ("Failure parsing '{}' -- not recognized as"
                      " a time expression")
+txt['percentile'] = "percentiles must be between 0 and 100"
+txt['plan-step'] = "Unrecognized plan step {}"
+txt['shape-mem'] = "shape_memory() takes a dict of shape strings to formats"
 txt['start-inv01'] = "start only valid in ceiling/floor when unit='week'"
 txt['start-inv02'] = "start must be a weekday name or abbreviation"
 txt['stubmsg'] = "{}() is a stub -- please complete it."
@@ -92,6 +92,26 @@ def test_month_constructor():
         assert mname in m._dict
 
 
+# -----------------------------------------------------------------------------
+def test_lexicon_shared():
+    """
+    month, week, time_units, and prepositions objects share the read-only
+    tables from nldt.lexicon()
+    """
+    pytest.debug_func()
+    lex = nldt.lexicon()
+    assert nldt.lexicon() is lex
+    assert nldt.month()._dict is nldt.month()._dict is lex['month']
+    assert nldt.week()._dict is lex['week']
+    assert nldt.time_units()._units is lex['units']
+    assert nldt.prepositions().preps is lex['preps']
+    assert 'october' in lex['mon_names']
+    with pytest.raises(TypeError):
+        lex['week']['mon'] = None
+    with pytest.raises(TypeError):
+        lex['month'][1]['days'] = 30
+
+
 # -----------------------------------------------------------------------------
 @pytest.mark.parametrize("month, year, exp", [
     pytest.param(1, None, 31, id="jan"),
@@ -166,6 +186,25 @@ def test_month_indexify(inp, exp):
         assert mon.indexify(inp) == exp
 
 
+# -----------------------------------------------------------------------------
+def test_indexable_aliases():
+    """
+    month.aliases() and week.aliases() map every accepted spelling to an
+    index and agree with indexify()
+    """
+    pytest.debug_func()
+    mon = nldt.month()
+    assert mon.aliases()['sept'] == mon.aliases()['09'] == 9
+    assert mon.indexify('SEPT') == 9
+    for key, idx in mon.aliases().items():
+        assert mon.indexify(key) == idx
+    wk = nldt.week()
+    assert wk.aliases()['thurs'] == wk.aliases()[3] == 3
+    assert 'th' not in wk.aliases()
+    with pytest.raises(TypeError):
+        wk.aliases()['th'] = 3
+
+
 # -----------------------------------------------------------------------------
 def test_month_under_days():
     """
@@ -607,6 +646,18 @@ def test_tu_find_unit(inp, exp):
     assert tu.find_unit(inp) == exp
 
 
+# -----------------------------------------------------------------------------
+def test_tu_find_unit_tokens():
+    """
+    time_units.find_unit() also takes a token list and returns the first
+    unit, in unit_list() order, that one of the tokens names
+    """
+    pytest.debug_func()
+    tu = nldt.time_units()
+    assert tu.find_unit(nldt.tokenize('three weeks and a day')) == 'day'
+    assert tu.find_unit(nldt.tokenize('next tuesday')) is None
+
+
 # -----------------------------------------------------------------------------
 @pytest.mark.parametrize("inp, exp", [
     pytest.param('second', 1, id='second'),
@@ -932,3 +983,15 @@ def test_word_before(text, target, exp):
     """
     pytest.debug_func()
     assert nldt.word_before(target, text) == exp
+
+
+# -----------------------------------------------------------------------------
+def test_word_before_tokens():
+    """
+    Given a token list and one of its tokens, word_before() returns the text
+    of the token before it, or None for the first token
+    """
+    pytest.debug_func()
+    tokens = nldt.tokenize('the week before last week')
+    assert nldt.word_before(tokens[4], tokens) == 'last'
+    assert nldt.word_before(tokens[0], tokens) is None
@@ -7,11 +7,13 @@ This file contains code for testing nldt functionality.
 """
 from fixtures import fx_calls_debug     # noqa
 from fixtures import xtime
+import bisect
 import nldt
 from nldt import duration as D
 from nldt import moment as M
 from nldt import numberize as num
 import numbers
+import pickle
 import pytest
 import time
 from nldt.text import txt
@@ -559,6 +561,20 @@ def test_duration_minus():
     assert txt['optypes-01'] in str(err)
 
 
+# -----------------------------------------------------------------------------
+def test_duration_minus_ns():
+    """
+    duration - duration and duration - number-of-seconds give a duration
+    counted in whole nanoseconds, however long the operands
+    """
+    pytest.debug_func()
+    diff = D(nanoseconds=10**18 + 1) - D(nanoseconds=10**18)
+    assert isinstance(diff, D) and diff.ns == 1
+    assert (D(seconds=2) - 0.5).ns == 1500000000
+    assert (D(seconds=1) - D(nanoseconds=1)).ns == 999999999
+    assert (D(hours=1) - D(minutes=30)).seconds == 1800
+
+
 # -----------------------------------------------------------------------------
 def test_duration_plus():
     """
@@ -730,6 +746,167 @@ def test_intuit(inp, fmt, exp):
     assert later(fmt) == exp
 
 
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("inp, shape, exp", [
+    pytest.param('16 October, 2018 12:30:45', '9 a, 9 9:9:9',
+                 '2018-10-16 12:30:45', id='d-B-comma'),
+    pytest.param('18-10-16', '9-9-9', '2018-10-16 00:00:00', id='y-m-d'),
+    pytest.param('1986.11 7', '9.9 9', '1986-11-07 00:00:00', id='d-blank'),
+    pytest.param('1986.1107 05', '9.9 9', '1986-11-07 05:00:00', id='Y.md-H'),
+    ])
+def test_intuit_shape(inp, shape, exp, monkeypatch):
+    """
+    A date/time string is only tried against the formats of its shape, in
+    their order in moment.formats. At most two share a shape ('%b' and '%B',
+    or '%Y.%m%d' where %d takes a blank), so strptime is called once or twice
+    """
+    pytest.debug_func()
+    calls = []
+    strptime = time.strptime
+
+    def counted(spec, fmt):
+        calls.append(fmt)
+        return strptime(spec, fmt)
+
+    assert nldt._shape(inp) == shape
+    assert len(set(nldt.moment.formats)) == len(nldt.moment.formats)
+    saved = nldt.moment.shape_memory('clear')
+    monkeypatch.setattr(time, 'strptime', counted)
+    result = nldt.moment(inp, itz='utc')
+    monkeypatch.undo()
+    nldt.moment.shape_memory('clear')
+    nldt.moment.shape_memory(saved)
+    assert len(calls) <= 2
+    assert calls == nldt.moment.shapes[shape][0][:len(calls)]
+    assert result('%F %T', otz='utc') == exp
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("inp, itz, exp", [
+    pytest.param('2018-02-16 11:49:13', 'utc', 1518781753, id='space'),
+    pytest.param('2018-02-16 11:49:13', 'US/Eastern', 1518799753,
+                 id='space-itz'),
+    pytest.param('2018-02-16T11:49:13Z', 'US/Eastern', 1518781753,
+                 id='zulu'),
+    pytest.param('2018-02-16T11:49:13.123+02:00', None, 1518774553,
+                 id='frac-offset'),
+    pytest.param('2018-02-16t11:49-0530', None, 1518801540, id='basic-off'),
+    pytest.param('2018-02-16T11', 'utc', 1518778800, id='hour'),
+    pytest.param('2000-02-29', 'utc', 951782400, id='leap'),
+    pytest.param('18-02-16', 'utc', 1518739200, id='fallback'),
+    pytest.param('2019-02-29', 'utc', ValueError(txt['no-match']),
+                 id='no-such-day'),
+    pytest.param('2018-02-16T11:49+24:00', 'utc',
+                 ValueError(txt['no-match']), id='bad-offset'),
+    ])
+def test_intuit_iso(inp, itz, exp):
+    """
+    ISO 8601 / RFC 3339 strings are read without strptime. An offset or 'Z'
+    in the string wins over *itz*. Anything else goes to moment.formats.
+    """
+    pytest.debug_func()
+    if isinstance(exp, Exception):
+        with pytest.raises(type(exp)) as err:
+            nldt.moment(inp, itz=itz)
+        assert str(exp) in str(err.value)
+    else:
+        assert nldt.moment(inp, itz=itz).epoch() == exp
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("epoch, otz, exp", [
+    pytest.param(1541300000, 'US/Eastern', '2018-11-03 22:53:20 EDT -0400',
+                 id='before-fall-back'),
+    pytest.param(1541311200, 'US/Eastern', '2018-11-04 01:00:00 EST -0500',
+                 id='after-fall-back'),
+    pytest.param(1541300000, 'Asia/Kolkata', '2018-11-04 08:23:20 IST +0530',
+                 id='half-hour'),
+    pytest.param(1541300000, 'America/St_Johns',
+                 '2018-11-04 00:23:20 NDT -0230', id='negative-half-hour'),
+    pytest.param(1541300000, 'utc', '2018-11-04 02:53:20 GMT +0000',
+                 id='utc'),
+    ])
+def test_moment_call_zone(epoch, otz, exp):
+    """
+    moment(fmt, otz) fills %Z and %z from the offset in effect at the moment
+    in zone *otz*. The prepared format is remembered in moment.formatters.
+    """
+    pytest.debug_func()
+    M.formatters.clear()
+    when = M(epoch)
+    assert when('%F %T %Z %z', otz=otz) == exp
+    assert when('%F %T', otz=otz) == exp[:19]
+    assert M.formatters['%F %T %Z %z'] == ('%Y-%m-%d %H:%M:%S %Z %z', True,
+                                           False)
+    assert M.formatters['%F %T'] == ('%Y-%m-%d %H:%M:%S', False, False)
+
+
+# -----------------------------------------------------------------------------
+def test_intuit_learned(monkeypatch):
+    """
+    After one string of a shape has matched, later strings of that shape are
+    tried against the same format first. The learned table can be exported
+    and loaded into a fresh process.
+    """
+    pytest.debug_func()
+    calls = []
+    strptime = time.strptime
+
+    def counted(spec, fmt):
+        calls.append(fmt)
+        return strptime(spec, fmt)
+
+    saved = nldt.moment.shape_memory('clear')
+    try:
+        monkeypatch.setattr(time, 'strptime', counted)
+        nldt.moment('16 October, 2018 12:30:45', itz='utc')
+        assert calls == ['%d %b, %Y %H:%M:%S', '%d %B, %Y %H:%M:%S']
+        del calls[:]
+        later = nldt.moment('17 November, 2018 01:02:03', itz='utc')
+        assert calls == ['%d %B, %Y %H:%M:%S']
+        monkeypatch.undo()
+        assert later('%F %T', otz='utc') == '2018-11-17 01:02:03'
+
+        table = nldt.moment.shape_memory()
+        assert table == {'9 a, 9 9:9:9': '%d %B, %Y %H:%M:%S'}
+        nldt.moment.shape_memory('clear')
+        assert nldt.moment.shape_memory() == {}
+        nldt.moment.shape_memory(table)
+        assert nldt.moment.shape_memory() == table
+        with pytest.raises(TypeError) as err:
+            nldt.moment.shape_memory({'9-9-9': 17})
+        assert txt['shape-mem'] in str(err.value)
+    finally:
+        nldt.moment.shape_memory('clear')
+        nldt.moment.shape_memory(saved)
+
+
+# -----------------------------------------------------------------------------
+def test_intuit_learned_order():
+    """
+    What was read before does not change what a string means: a format is
+    only learned if trying it first cannot pick a different reading than
+    trying the formats in order
+    """
+    pytest.debug_func()
+    saved = nldt.moment.shape_memory('clear')
+    try:
+        before = nldt.moment('1986.11 7', itz='utc')
+        assert before('%F %T', otz='utc') == '1986-11-07 00:00:00'
+        hour = nldt.moment('1986.1107 05', itz='utc')
+        assert hour('%F %T', otz='utc') == '1986-11-07 05:00:00'
+        after = nldt.moment('1986.11 7', itz='utc')
+        assert after == before
+        assert nldt.moment.shape_memory() == {'9.9 9': '%Y.%m%d'}
+
+        nldt.moment.shape_memory({'9.9 9': '%Y.%m%d %H'})
+        assert nldt.moment.shape_memory() == {'9.9 9': '%Y.%m%d'}
+        assert nldt.moment('1986.11 7', itz='utc') == before
+    finally:
+        nldt.moment.shape_memory('clear')
+        nldt.moment.shape_memory(saved)
+
+
 # -----------------------------------------------------------------------------
 def test_local():
     """
@@ -933,6 +1110,39 @@ def test_moment_floor():
     assert "'frumpy' is not a time unit" in str(err)
 
 
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("inp, unit, start, flr, ceil", [
+    ('1600-02-29 13:14:15', 'month', None, (1600, 2, 1), (1600, 2, 29)),
+    ('1900-02-28 13:14:15', 'year', None, (1900, 1, 1), (1900, 12, 31)),
+    ('0001-01-10 00:00:00', 'week', None, (1, 1, 8), (1, 1, 14)),
+    ('9999-12-31 23:59:59', 'week', 'sun', (9999, 12, 26), (10000, 1, 1)),
+    ('9999-12-31 23:59:59', 'month', None, (9999, 12, 1), (9999, 12, 31)),
+    ])
+def test_moment_floor_far(inp, unit, start, flr, ceil):
+    """
+    floor() and ceiling() are worked out from the epoch alone, so they are
+    right for years before 1970 and beyond what the platform's gmtime() and
+    timegm() can handle.
+    """
+    pytest.debug_func()
+    when = M(inp, itz='utc')
+    lo = when.floor(unit, start=start)
+    hi = when.ceiling(unit, start=start)
+    assert nldt._civil_from_days(lo.epoch() // 86400) == flr
+    assert lo.epoch() % 86400 == 0
+    assert nldt._civil_from_days(hi.epoch() // 86400) == ceil
+    assert hi.epoch() % 86400 == 86399
+
+    far = M._from_epoch(2 ** 62)
+    year, mon, mday = nldt._civil_from_days(2 ** 62 // 86400)
+    assert nldt._civil_from_days(far.floor('year').epoch() // 86400) \
+        == (year, 1, 1)
+    assert far.ceiling('month').epoch() + 1 == \
+        far.floor('month').epoch() + 86400 * (
+            nldt._days_from_civil(year + mon // 12, mon % 12 + 1, 1) -
+            nldt._days_from_civil(year, mon, 1))
+
+
 # -----------------------------------------------------------------------------
 def test_moment_gmtime():
     """
@@ -1065,6 +1275,293 @@ def test_moment_localtime(inp_time, inp_tz, out_tz, out_time):
     assert nldt.timegm(actual) == nldt.timegm(expected)
 
 
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("inp, tz, exp", [
+    pytest.param('2042-06-15 12:00:00', 'US/Eastern', '08:00:00 EDT -0400 1',
+                 id='edt'),
+    pytest.param('2042-12-15 12:00:00', 'US/Eastern', '07:00:00 EST -0500 0',
+                 id='est'),
+    pytest.param('2061-07-04 12:00:00', 'Europe/Paris',
+                 '14:00:00 CEST +0200 1', id='cest'),
+    ])
+def test_moment_localtime_late(inp, tz, exp):
+    """
+    Past the end of pytz's transition tables (2037), a zone still follows its
+    daylight saving rule
+    """
+    pytest.debug_func()
+    when = nldt.moment(inp, itz='utc')
+    ltm = when.localtime(tz)
+    assert "{} {}".format(when('%T %Z %z', otz=tz), ltm.tm_isdst) == exp
+    np = pytest.importorskip('numpy')
+    marr = nldt.MomentArray(np.array([when.epoch()], dtype=np.int64))
+    assert list(marr('%T %Z', otz=tz)) == [when('%T %Z', otz=tz)]
+
+
+# -----------------------------------------------------------------------------
+def test_moment_slots():
+    """
+    moment and duration keep their value in a slot rather than a __dict__, and
+    the arithmetic results built by the fast constructors behave like ones
+    built by __init__()
+    """
+    pytest.debug_func()
+    then = nldt.moment(1539702123)
+    assert not hasattr(then, '__dict__')
+    assert not hasattr(nldt.duration(seconds=5), '__dict__')
+    with pytest.raises(AttributeError):
+        then.other = 17
+    fast = nldt.moment._from_epoch(1539702123)
+    assert type(fast) is nldt.moment
+    assert fast == then
+    assert repr(then + 3) == 'nldt.moment(1539702126)'
+    assert (then + 3.5).epoch() == 1539702126
+    assert (then - 3) == nldt.moment(1539702120)
+    assert (then - nldt.moment(1539702000)) == nldt.duration(seconds=123)
+    assert nldt.duration(seconds=3) + 4 == nldt.duration(seconds=7)
+    assert nldt.duration(seconds=3) + then == nldt.moment(1539702126)
+    assert then.floor('day') == nldt.moment('2018-10-16', itz='utc')
+
+
+# -----------------------------------------------------------------------------
+def test_moment_ns():
+    """
+    moments and durations count nanoseconds. Fractions of a second survive
+    parsing, arithmetic, and %f / %N output, while epoch(), the moment
+    attribute, and whole-second durations behave as they always have.
+    """
+    pytest.debug_func()
+    then = M('2018-02-16T11:49:13.123456789Z')
+    assert then.epoch_ns() == 1518781753123456789
+    assert then.epoch() == then.moment == 1518781753
+    assert then('%T.%f %N', otz='utc') == '11:49:13.123456 123456789'
+    assert repr(then) == 'nldt.moment.from_ns(1518781753123456789)'
+    assert eval(repr(then)) == then
+    assert then != M(1518781753)
+    assert then.floor('second') == M(1518781753)
+
+    gap = then - M('2018-02-16T11:49:13.123456788Z')
+    assert gap.ns == 1
+    assert gap == D(nanoseconds=1)
+    assert (then + D(seconds=0.5)).epoch_ns() == 1518781753623456789
+    assert (then - 1).epoch_ns() == 1518781752123456789
+
+    assert D(seconds=1.5).seconds == 1.5
+    assert D(seconds=90).seconds == 90
+    assert isinstance(D(seconds=90).seconds, int)
+    assert D(seconds=90).hms() == '00:01:30'
+
+    fmt = '%Y-%m-%d %H:%M:%S.%f'
+    assert M('2018-02-16 11:49:13.25', fmt, itz='utc').ns % 10**9 == 250000000
+    before = time.time_ns()
+    now = M.now_ns()
+    assert before <= now.epoch_ns() <= time.time_ns()
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("proto", range(pickle.HIGHEST_PROTOCOL + 1))
+def test_moment_pickle(proto):
+    """
+    moments and durations pickle as their nanosecond counts, under every
+    protocol
+    """
+    pytest.debug_func()
+    for item in [M('2018-02-16T11:49:13.123456789Z'), M(-86400),
+                 D(seconds=90), D(nanoseconds=-7)]:
+        data = pickle.dumps(item, proto)
+        assert pickle.loads(data) == item
+        assert type(pickle.loads(data)) is type(item)
+    assert len(pickle.dumps(M(1518781753), 2)) < 47
+
+
+# -----------------------------------------------------------------------------
+def test_moment_order():
+    """
+    moments and durations are ordered and hashable, against their own kind
+    and against numbers, and sort_key gives the same order as the comparisons
+    """
+    pytest.debug_func()
+    first = M.from_ns(1518781753000000001)
+    moms = [M(1518781754), first, M(1518781753), M(1518781752)]
+    assert sorted(moms) == sorted(moms, key=M.sort_key)
+    assert sorted(moms)[1:3] == [M(1518781753), first]
+    assert min(moms) == M(1518781752) and max(moms) == M(1518781754)
+    assert bisect.bisect(sorted(moms), first) == 3
+    assert M(1518781753) < first <= first < M(1518781754)
+    assert first > 1518781753 and first >= 1518781753 and first < 1518781754
+    assert len({M(1518781753), M('2018-02-16T11:49:13Z'), first}) == 2
+    assert {1518781753: 'x'}[M(1518781753)] == 'x'
+    with pytest.raises(TypeError):
+        M(1518781753) < 'tomorrow'
+
+    half = M.from_ns(1500000000500000000)
+    assert half != 1500000000 and half > 1500000000
+    assert half == 1500000000.5 and not half < 1500000000.5
+    assert hash(half) == hash(1500000000.5)
+    assert half != '1500000000' and half != (2017, 7, 14, 2, 40, 0)
+    assert half != M('2017-07-14 02:40:00') < half
+    assert half == M.from_ns(1500000000500000000)
+    assert len({half, M(1500000000), M.from_ns(1500000000500000000)}) == 2
+    assert half != float('nan') and half < float('inf')
+
+    durs = [D(seconds=3), D(nanoseconds=1), D(seconds=1.5)]
+    assert sorted(durs) == sorted(durs, key=D.sort_key)
+    assert sorted(durs) == [D(nanoseconds=1), D(seconds=1.5), D(seconds=3)]
+    assert D(seconds=1.5) > 1 and D(seconds=1.5) <= 1.5
+    assert {5: 'y'}[D(seconds=5)] == 'y'
+    assert len({D(seconds=2), D(minutes=1), D(seconds=60)}) == 2
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("otz", ['utc', 'local', 'US/Eastern', 'Asia/Kolkata'])
+def test_moment_array(otz):
+    """
+    Each MomentArray operation gives, element by element, what the moment
+    method of the same name gives
+    """
+    pytest.debug_func()
+    np = pytest.importorskip('numpy')
+    epochs = np.arange(-400000000, 2000000000, 3 * 86400 + 3607,
+                       dtype=np.int64)
+    marr = nldt.MomentArray(epochs)
+    moms = [M(int(epoch)) for epoch in epochs]
+    assert len(marr) == len(moms) and list(marr) == moms
+    assert marr[5] == moms[5] and type(marr[5]) is M
+    assert isinstance(marr[:5], nldt.MomentArray)
+    fmt = '%a %b %e %Y.%m%d %T %p %j %Z %z %%'
+    assert list(marr(fmt, otz=otz)) == [mom(fmt, otz=otz) for mom in moms]
+    for unit in ['second', 'minute', 'hour', 'day', 'week', 'month', 'year']:
+        assert list(marr.floor(unit)) == [mom.floor(unit) for mom in moms]
+        assert list(marr.ceiling(unit)) == [mom.ceiling(unit) for mom in moms]
+    assert list(marr.floor('week', 'sun')) == [mom.floor('week', 'sun')
+                                               for mom in moms]
+    wk = nldt.week()
+    assert list(marr.day_number('sun0')) == [wk.day_number(mom, 'sun0')
+                                             for mom in moms]
+    tms = [tuple(mom.localtime(None if otz == 'local' else otz))
+           for mom in moms]
+    assert list(zip(marr.year(otz), marr.month(otz), marr.mday(otz),
+                    marr.hour(otz), marr.minute(otz), marr.second(otz),
+                    marr.wday(otz), marr.yday(otz))) == [tm[:8] for tm in tms]
+    later = marr + D(days=1, seconds=2)
+    assert list(later) == [mom + D(days=1, seconds=2) for mom in moms]
+    assert list(later - marr) == [86402] * len(moms)
+    assert list((later - 86402) == marr) == [True] * len(moms)
+    assert list(marr < moms[3]) == [mom < moms[3] for mom in moms]
+    with pytest.raises(TypeError):
+        marr + moms[0]
+    assert list(nldt.MomentArray(['2018-10-16', M(17), 18.5])[1:]) == [M(17),
+                                                                       M(18)]
+
+
+# -----------------------------------------------------------------------------
+def test_duration_array():
+    """
+    DurationArray renders, reduces, and combines with MomentArray the way the
+    duration methods do one value at a time
+    """
+    pytest.debug_func()
+    np = pytest.importorskip('numpy')
+    counts = [0, 1, -1, 500000000, -90 * 10**9, 3725 * 10**9,
+              86461 * 10**9 + 7, -400 * 86400 * 10**9 - 1, 10**17]
+    darr = nldt.DurationArray.from_ns(counts)
+    durs = [D(nanoseconds=count) for count in counts]
+    assert list(darr) == durs and darr[3] == D(seconds=0.5)
+    assert list(darr.dhms()) == [dur.dhms() for dur in durs]
+    assert list(darr.hms()) == [dur.hms() for dur in durs]
+    fmt = '%Y years %d days %H:%M:%S'
+    assert list(darr(fmt)) == [dur(fmt) for dur in durs]
+
+    assert darr.sum() == D(nanoseconds=sum(counts))
+    assert darr.min() == min(durs) and darr.max() == max(durs)
+    assert darr.median() == D(nanoseconds=1)
+    assert list(darr.percentile([0, 100])) == [min(durs), max(durs)]
+    waits = nldt.DurationArray([1, 2, 4])
+    assert waits.mean() == D(nanoseconds=2333333333)
+    assert list(waits.seconds()) == [1.0, 2.0, 4.0]
+    many = nldt.DurationArray.from_ns(np.full(3000000, 9 * 10**12))
+    assert many.sum() == D(nanoseconds=27 * 10**18)
+    empty = nldt.DurationArray([])
+    assert empty.sum() == D(seconds=0)
+    for name in ['max', 'mean', 'median', 'min']:
+        with pytest.raises(ValueError) as err:
+            getattr(empty, name)()
+        exp = 'percentile' if name == 'median' else name
+        assert txt['no-durations'].format(exp) in str(err.value)
+    with pytest.raises(ValueError) as err:
+        empty.percentile([25, 75])
+    assert txt['no-durations'].format('percentile') in str(err.value)
+
+    starts = nldt.MomentArray([1539702123, 1540393323])
+    ends = starts + nldt.DurationArray([30, 90.5])
+    assert list(ends) == [M(1539702153), M(1540393413)]
+    assert list(ends - starts) == [D(seconds=30), D(seconds=90)]
+    assert list(M(1540393413) - starts) == [D(seconds=691290), D(seconds=90)]
+    assert list(waits + D(seconds=1)) == [D(seconds=2), D(seconds=3),
+                                          D(seconds=5)]
+    assert list(waits * 2 == 4) == [False, True, False]
+    assert list(-waits < 0) == [True, True, True]
+
+
+# -----------------------------------------------------------------------------
+def test_array_bytes():
+    """
+    MomentArray and DurationArray write their columns as little-endian int64
+    records and wrap such records in place, from any buffer, and pickle as
+    their arrays
+    """
+    pytest.debug_func()
+    np = pytest.importorskip('numpy')
+    days = nldt.MomentArray([1539702123, -1, 2 ** 40])
+    raw = days.to_bytes()
+    assert raw == np.array(days.epochs, dtype='<i8').tobytes()
+    assert len(raw) == 24
+
+    store = bytearray(raw)
+    back = nldt.MomentArray.from_buffer(store)
+    assert list(back == days) == [True, True, True]
+    assert np.shares_memory(back.epochs, np.frombuffer(store, dtype='u1'))
+    part = nldt.MomentArray.from_buffer(memoryview(store)[8:])
+    assert list(part) == [M(-1), M(2 ** 40)]
+    assert list(nldt.MomentArray.from_buffer(raw, count=1, offset=8)) \
+        == [M(-1)]
+
+    waits = nldt.DurationArray([1.5, -2])
+    again = nldt.DurationArray.from_buffer(waits.to_bytes())
+    assert list(again) == [D(seconds=1.5), D(seconds=-2)]
+
+    for item in [days, waits]:
+        copy = pickle.loads(pickle.dumps(item))
+        assert type(copy) is type(item)
+        assert list(copy == item) == [True] * len(item)
+
+
+# -----------------------------------------------------------------------------
+def test_moment_rejects():
+    """
+    A date/time string that matched none of moment.formats is remembered and
+    turned away without trying the formats again, until the formats change
+    """
+    pytest.debug_func()
+    junk = 'not a date 1234'
+    before = nldt.moment.reject_info()
+    for _ in range(3):
+        with pytest.raises(ValueError) as err:
+            nldt.moment(junk)
+        assert txt['no-match'] in str(err.value)
+    after = nldt.moment.reject_info()
+    assert after['failed'] == before['failed'] + 1
+    assert after['rejected'] == before['rejected'] + 2
+    assert junk in nldt.moment.rejects
+    nldt.moment.formats.append('nope %Y')
+    try:
+        with pytest.raises(ValueError):
+            nldt.moment(junk)
+        assert nldt.moment.reject_info()['failed'] == after['failed'] + 1
+    finally:
+        nldt.moment.formats.pop()
+
+
 # -----------------------------------------------------------------------------
 @pytest.mark.parametrize("minuend, subtrahend, exp", [
     pytest.param(M("2010-11-07"), D(days=3), M("2010-11-04"), id='001'),
@@ -8,8 +8,12 @@ This file contains code for testing nldt functionality.
 # class Parser
 from fixtures import nl_oracle
 from nldt import moment as M
+import collections
 import nldt
+import nldt.bulk
+import os
 import pytest
+import threading
 import time
 from nldt.text import txt
 
@@ -168,3 +172,481 @@ def test_parser_research():
         if prs.research("boofar", "one two boofar three four", frink):
             assert frink == "this is a string"
     assert "result must be an empty list" in str(err)
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("inp, exp", [
+    pytest.param('end of next week', 'of_in', id='of_in'),
+    pytest.param('first week in June', 'of_in', id='of_in-week'),
+    pytest.param(' October ', 'mon_name', id='mon_name'),
+    pytest.param('tomorrow', 'yestermorrow', id='yestermorrow'),
+    pytest.param('three weeks ago', 'ago', id='ago'),
+    pytest.param('an hour from now', 'from_now', id='from_now'),
+    pytest.param('next month', 'month', id='month'),
+    pytest.param('week after next', 'week', id='week'),
+    pytest.param('monday week', 'week', id='week-over-weekday'),
+    pytest.param('last year', 'year', id='year'),
+    pytest.param('next friday', 'weekday', id='weekday'),
+    pytest.param('one two', None, id='none'),
+    ])
+def test_parser_dispatch(inp, exp):
+    """
+    Parser.dispatch() picks the highest ranked rule whose keyword appears in
+    the expression
+    """
+    pytest.debug_func()
+    prs = nldt.Parser()
+    rule, match = prs.dispatch(inp)
+    assert rule == exp
+    if rule == 'weekday':
+        assert match.text == 'friday'
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("inp, exp", [
+    pytest.param('three weeks ago',
+                 [('number', 3), ('unit', 'week'), ('word', None)],
+                 id='ago'),
+    pytest.param('Twenty-one days from now',
+                 [('number', 21), ('unit', 'day'), ('prep', 1),
+                  ('word', None)],
+                 id='from_now'),
+    pytest.param('first week in June',
+                 [('number', 1), ('unit', 'week'), ('prep', 1),
+                  ('month', 6)],
+                 id='of_in'),
+    pytest.param('next Friday', [('modifier', 1), ('weekday', 4)],
+                 id='weekday'),
+    pytest.param('a second and 2 hours',
+                 [('word', None), ('unit', 'second'), ('word', None),
+                  ('number', 2), ('unit', 'hour')],
+                 id='and-digits'),
+    ])
+def test_tokenize(inp, exp):
+    """
+    nldt.tokenize() classifies each word of an expression in one pass and
+    merges runs of number words
+    """
+    pytest.debug_func()
+    tokens = nldt.tokenize(inp)
+    assert [(tok.kind, tok.value) for tok in tokens] == exp
+    assert [tok.pos for tok in tokens] == list(range(len(exp)))
+
+
+# -----------------------------------------------------------------------------
+def test_parser_cache():
+    """
+    With cache_size set, repeated expressions are served from the cache until
+    evicted, anchors in the same week share the 'last week' entry, and
+    changing the default timezone invalidates the cache
+    """
+    pytest.debug_func()
+    tz_orig = nldt.moment.default_tz()
+    prs = nldt.Parser(cache_size=2)
+    mon = M("2018-10-15 08:00:00", itz='utc')
+    thu = M("2018-10-18 17:30:00", itz='utc')
+    assert prs('last week', mon) == prs('last week', thu)
+    assert prs.cache_info() == {'hits': 1, 'misses': 1, 'size': 1,
+                                'maxsize': 2}
+    assert prs('yesterday', mon)() == "2018-10-14"
+    assert prs('next year', mon)() == "2019-01-01"
+    assert prs.cache_info()['size'] == 2
+    prs('last week', thu)
+    assert prs.cache_info()['misses'] == 4
+
+    nldt.moment.default_tz('US/Eastern')
+    prs('next year', mon)
+    assert prs.cache_info()['size'] == 1
+    prs.cache_clear()
+    assert prs.cache_info() == {'hits': 0, 'misses': 0, 'size': 0,
+                                'maxsize': 2}
+    nldt.moment.default_tz(tz_orig)
+
+
+# -----------------------------------------------------------------------------
+def test_parser_cache_fresh():
+    """
+    Each cache hit is a new moment, so changing one result does not change
+    later ones, and 'now' keeps the fraction of a second of each anchor
+    """
+    pytest.debug_func()
+    prs = nldt.Parser(cache_size=8)
+    mon = M("2018-10-15 08:00:00", itz='utc')
+    first = prs('tomorrow', mon)
+    first.ns += 3600 * 10**9
+    again = prs('tomorrow', mon)
+    assert again is not first
+    assert again(otz='utc') == "2018-10-16"
+    assert prs.cache_info()['hits'] == 1
+
+    early = M.from_ns(mon.ns + 250000000)
+    late = M.from_ns(mon.ns + 750000000)
+    assert prs('now', early).ns == early.ns
+    assert prs('now', late).ns == late.ns
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("expr, exp", [
+    pytest.param('tomorrow', 86400 * 10**9, id='tomorrow'),
+    pytest.param('three days ago', -3 * 86400 * 10**9, id='shift'),
+    pytest.param('next monday', 6 * 86400 * 10**9, id='next_wday'),
+    pytest.param('last friday', -4 * 86400 * 10**9, id='last_wday'),
+    pytest.param('next week', (5 * 86400 + 12 * 3600) * 10**9 - 500000000,
+                 id='floor'),
+    ])
+def test_plan_fraction(expr, exp):
+    """
+    A fraction of a second in the anchor is kept through relative steps and
+    dropped by absolute ones, with or without the result cache
+    """
+    pytest.debug_func()
+    anchor = M.from_ns(M("2018-10-16 12:00:00", itz='utc').ns + 500000000)
+    assert (nldt.Parser()(expr, anchor) - anchor).ns == exp
+    prs = nldt.Parser(cache_size=8)
+    prs(expr, M.from_ns(anchor.ns - 250000000))
+    assert (prs(expr, anchor) - anchor).ns == exp
+
+
+# -----------------------------------------------------------------------------
+def test_parse_many():
+    """
+    Parser.parse_many() resolves a batch against one anchor and returns the
+    results in input order, as moments or as an array of epochs
+    """
+    pytest.debug_func()
+    prs = nldt.Parser()
+    anchor = M("2018-10-16 15:02:03", itz='utc')
+    inp = ['next week', 'yesterday', 'next week', 'last month', 'now']
+    result = prs.parse_many(inp, start=anchor)
+    assert [x(otz='utc') for x in result] == ['2018-10-22', '2018-10-15',
+                                              '2018-10-22', '2018-09-01',
+                                              '2018-10-16']
+    assert result[-1] is anchor
+    epochs = prs.parse_many(inp, start=anchor, epochs=True)
+    assert epochs.typecode == 'q'
+    assert list(epochs) == [x.epoch() for x in result]
+
+
+# -----------------------------------------------------------------------------
+def test_parser_compile():
+    """
+    Parser.compile() returns a plan that can be pickled, run against any
+    anchor, and gives the same result as calling the parser with that anchor
+    """
+    pytest.debug_func()
+    import pickle
+    prs = nldt.Parser()
+    plan = prs.compile('week after next')
+    assert plan.steps == (('floor', 'week', 2),)
+    assert pickle.loads(pickle.dumps(plan)) == plan
+    for when in ["2018-10-15 08:00:00", "2018-12-31 23:00:00",
+                 "2016-02-29 12:00:00"]:
+        anchor = M(when, itz='utc')
+        for expr in ['week after next', 'two days ago', 'end of last month',
+                     'next friday', 'first week in June']:
+            assert prs.compile(expr)(anchor) == prs(expr, anchor)
+    anchor = M("2018-10-15 08:00:00", itz='utc')
+    assert prs('two days ago', anchor)('%F %T') == "2018-10-13 08:00:00"
+    with pytest.raises(nldt.ParseError):
+        prs.compile('one two')
+
+
+# -----------------------------------------------------------------------------
+def test_plan_evaluate():
+    """
+    Plan.evaluate() runs a plan over an array of epochs and matches calling
+    the plan on each epoch
+    """
+    pytest.debug_func()
+    np = pytest.importorskip('numpy')
+    prs = nldt.Parser()
+    epochs = np.arange(1514764800, 1546300800, 37 * 3600 + 11,
+                       dtype=np.int64)
+    for expr in ['last week', 'end of next month', 'next tuesday',
+                 'next year', 'May', 'first week in June', 'yesterday']:
+        plan = prs.compile(expr)
+        result = plan.evaluate(epochs)
+        assert result.dtype == np.int64
+        assert list(result) == [plan(int(x)).epoch() for x in epochs]
+    assert plan.evaluate([]).size == 0
+
+
+# -----------------------------------------------------------------------------
+def test_extract():
+    """
+    nldt.extract() finds the expressions the parser understands in running
+    text, reports their spans in the whole stream, and gives the same results
+    whether the text comes in one piece or in chunks
+    """
+    pytest.debug_func()
+    anchor = M("2018-10-16 12:00:00", itz='utc')
+    text = ("You may file it Monday. Filed 3 days ago, due next monday;\n"
+            "closed the end of next month, reopened twenty-one days from now")
+    result = [(text[beg:end], when('%F %T', otz='utc'))
+              for (beg, end), when in nldt.extract(text, start=anchor)]
+    assert result == [('3 days ago', '2018-10-13 12:00:00'),
+                      ('next monday', '2018-10-22 12:00:00'),
+                      ('end of next month', '2018-11-30 23:59:59'),
+                      ('twenty-one days from now', '2018-11-06 12:00:00')]
+    chunks = [text[idx:idx + 7] for idx in range(0, len(text), 7)]
+    assert list(nldt.extract(chunks, start=anchor)) == \
+        list(nldt.extract(text, start=anchor))
+    assert list(nldt.extract("")) == []
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("text, span, exp", [
+    pytest.param("Call me in two days from now", 'two days from now',
+                 '2018-10-18 12:00:00', id='in-count'),
+    pytest.param("the week after next", 'week after next',
+                 '2018-10-29 00:00:00', id='the-week'),
+    ])
+def test_extract_lead(text, span, exp):
+    """
+    nldt.extract() does not let a leading preposition or article change the
+    expression, and reports the candidate that uses the most words
+    """
+    pytest.debug_func()
+    anchor = M("2018-10-16 12:00:00", itz='utc')
+    result = [(text[beg:end], when('%F %T', otz='utc'))
+              for (beg, end), when in nldt.extract(text, start=anchor)]
+    assert result == [(span, exp)]
+
+
+# -----------------------------------------------------------------------------
+def test_extract_long_word():
+    """
+    A word longer than any date word, arriving over many chunks, is passed
+    over without holding up the expressions around it
+    """
+    pytest.debug_func()
+    anchor = M("2018-10-16 12:00:00", itz='utc')
+    text = "next week " + "A" * 100000 + " three days ago" + " " * 1000
+    chunks = (text[idx:idx + 100] for idx in range(0, len(text), 100))
+    result = [(text[beg:end], when('%F', otz='utc'))
+              for (beg, end), when in nldt.extract(chunks, start=anchor)]
+    assert result == [('next week', '2018-10-22'),
+                      ('three days ago', '2018-10-13')]
+
+
+# -----------------------------------------------------------------------------
+def test_parser_instrument():
+    """
+    An instrumented Parser records the rule, stage timings, and counts for
+    each call, hands each record to a callback, and totals them in stats()
+    """
+    pytest.debug_func()
+    records = []
+    prs = nldt.Parser(instrument=records.append)
+    anchor = M("2018-10-16 12:00:00", itz='utc')
+    expected = nldt.Parser()('end of next week', anchor)
+    assert prs('end of next week', anchor) == expected
+    rec = records[-1]
+    assert rec['expr'] == 'end of next week'
+    assert rec['rule'] == 'of_in'
+    assert rec['recursion'] == 1
+    assert set(rec['time']) == set(nldt.Parser.stages)
+    assert rec['time']['total'] >= rec['time']['evaluate'] > 0
+    prs('next year', anchor)
+    assert records[-1]['utc_offset'] == 1
+    with pytest.raises(nldt.ParseError):
+        prs('one two', anchor)
+    stats = prs.stats()
+    assert stats['calls'] == 3
+    assert stats['rules'] == {'of_in': 1, 'year': 1, None: 1}
+    assert stats['recursion'] == 1
+    assert stats['slowest'] in records
+    prs.stats_clear()
+    assert prs.stats()['calls'] == 0
+    assert nldt.Parser().stats()['calls'] == 0
+
+
+# -----------------------------------------------------------------------------
+def test_parser_instrument_cached():
+    """
+    With the caches on, hits are counted under the rule that compiled the
+    expression, failures under the rule that failed (None if none applied),
+    and a failed compile still reports the time spent before it failed
+    """
+    pytest.debug_func()
+    records = []
+    prs = nldt.Parser(cache_size=8, instrument=records.append)
+    anchor = M("2018-10-16 12:00:00", itz='utc')
+    for _ in range(3):
+        prs('next year', anchor)
+        prs('end of next week', M("2018-10-17 12:00:00", itz='utc'))
+        with pytest.raises(nldt.ParseError):
+            prs('one two', anchor)
+    assert [rec['cached'] for rec in records[3:]] == [True] * 6
+    stats = prs.stats()
+    assert stats['rules'] == {'year': 3, 'of_in': 3, None: 3}
+    assert records[2]['time']['tokenize'] > 0
+    assert records[2]['time']['dispatch'] > 0
+    assert prs.compile('next year').rule == 'year'
+
+
+# -----------------------------------------------------------------------------
+def test_parser_bulk():
+    """
+    nldt.bulk.parse() spreads the work over worker processes and returns the
+    epochs in input order, with FAILED for expressions that do not resolve
+    """
+    pytest.debug_func()
+    anchor = M("2018-10-16 12:00:00", itz='utc')
+    exprs = ['tomorrow', 'next week', 'no such thing', 'three days ago']
+    prs = nldt.Parser()
+    expected = [prs(x, anchor).epoch() for x in exprs if x != 'no such thing']
+    expected.insert(2, nldt.bulk.FAILED)
+    result = nldt.bulk.parse(iter(exprs * 5), anchor, workers=2, chunk=3)
+    assert result.typecode == 'q'
+    assert list(result) == expected * 5
+    assert len(nldt.bulk.parse([], anchor, workers=2)) == 0
+
+
+# -----------------------------------------------------------------------------
+def test_parser_bulk_spawn(monkeypatch):
+    """
+    Spawned workers read dates in the caller's default timezone, and items
+    that are not strings or overflow the platform's time functions come back
+    FAILED instead of sinking the chunk
+    """
+    pytest.debug_func()
+    import multiprocessing
+    from concurrent import futures
+    pool = futures.ProcessPoolExecutor
+    spawn = multiprocessing.get_context('spawn')
+    monkeypatch.setattr(futures, 'ProcessPoolExecutor',
+                        lambda *a, **kw: pool(*a, mp_context=spawn, **kw))
+    tz_orig = nldt.moment.default_tz()
+    nldt.moment.default_tz('Asia/Tokyo')
+    try:
+        anchor = M("2018-10-16 12:00:00", itz='utc')
+        exprs = ['next year', 5, '99999999999999999999 years ago']
+        result = nldt.bulk.parse(exprs, anchor, workers=1)
+        expected = nldt.Parser()('next year', anchor).epoch()
+    finally:
+        nldt.moment.default_tz(tz_orig)
+    assert list(result) == [expected, nldt.bulk.FAILED, nldt.bulk.FAILED]
+
+
+# -----------------------------------------------------------------------------
+def test_parser_threads():
+    """
+    Several threads sharing one Parser get the same answers as a serial run,
+    and neither parsing nor formatting for another zone touches
+    os.environ['TZ']
+    """
+    pytest.debug_func()
+    anchor = M("2018-10-16 12:00:00", itz='utc')
+    exprs = ['next week', 'end of next month', 'three days ago', 'next friday',
+             'beginning of next year', 'tomorrow']
+    zones = ['utc', 'Asia/Tokyo', 'US/Pacific', 'Europe/Paris']
+    prs = nldt.Parser(cache_size=16, instrument=True)
+    expected = {(expr, otz): prs(expr, anchor)('%F %T %Z', otz=otz)
+                for expr in exprs for otz in zones}
+    tzorig = os.environ.get('TZ')
+    failed = []
+
+    def worker():
+        for _ in range(20):
+            for (expr, otz), exp in expected.items():
+                if prs(expr, anchor)('%F %T %Z', otz=otz) != exp:
+                    failed.append((expr, otz))
+                if os.environ.get('TZ') != tzorig:
+                    failed.append('TZ')
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thr in threads:
+        thr.start()
+    for thr in threads:
+        thr.join()
+    assert failed == []
+    assert prs.stats()['calls'] == 81 * len(expected)
+    assert prs.stats()['tzset'] == 0
+
+
+# -----------------------------------------------------------------------------
+def test_parser_rejects():
+    """
+    An expression that failed once is turned away from Parser.rejects the
+    next time, with the same error, and the counters say so
+    """
+    pytest.debug_func()
+    prs = nldt.Parser(reject_size=2)
+    for _ in range(3):
+        with pytest.raises(nldt.ParseError) as err:
+            prs('no such thing')
+        assert txt['parse-fail'].format('no such thing') in str(err.value)
+    with pytest.raises(ValueError):
+        prs('no number no unit ago')
+    with pytest.raises(nldt.ParseError):
+        prs('more junk')
+    assert prs.reject_info() == {'rejected': 2, 'failed': 3,
+                                 'size': 2, 'maxsize': 2}
+    assert 'no such thing' not in prs.rejects
+    prs.cache_clear()
+    assert prs.reject_info()['size'] == 0
+
+
+# -----------------------------------------------------------------------------
+def test_parser_session():
+    """
+    A Session follows an expression as it is typed, reporting whether it is
+    complete, viable, or dead, offering completions, and resolving it once it
+    is complete
+    """
+    pytest.debug_func()
+    anchor = M("2018-10-16 12:00:00", itz='utc')
+    sess = nldt.Parser().session(anchor)
+    assert sess.update('n') == 'viable'
+    assert sess.update('next m') == 'viable'
+    assert sess.completions() == ['monday', 'month']
+    assert sess.result() is None
+    assert sess.update('next monday') == 'complete'
+    assert sess.result() == nldt.Parser()('next monday', anchor)
+    assert sess.update('next mondayx') == 'dead'
+    assert sess.update('next monday ') == 'complete'
+    assert sess.completions() == ['in', 'of']
+    assert sess.update('next mo') == 'viable'
+    assert sess.update('three weeks ago') == 'complete'
+    assert sess.result()('%F %T', otz='utc') == "2018-09-25 12:00:00"
+    assert nldt.Session().feed('first week in ju') == 'viable'
+
+
+# -----------------------------------------------------------------------------
+def test_session_real_words():
+    """
+    Session completions offer only real words: number words and their true
+    ordinal forms, never one made up by adding 'th'
+    """
+    pytest.debug_func()
+    invented = set(['andth', 'eightth', 'nineth', 'oneth', 'twelveth',
+                    'twoth', 'threeth', 'fiveth', 'twentyth'])
+    sess = nldt.Session()
+    offered = set()
+    for prefix in 'aefnot':
+        sess.update(prefix)
+        offered.update(sess.completions())
+    assert not offered & invented
+    assert set(['eight', 'eighth', 'first', 'twelfth']) <= offered
+    assert not nldt.lexicon()['words'].keys() & invented
+
+
+# -----------------------------------------------------------------------------
+def test_session_memo_lru(monkeypatch):
+    """
+    Once Session.memo is full, the least recently used transitions are
+    dropped to make room, so new ones are still remembered
+    """
+    pytest.debug_func()
+    monkeypatch.setattr(nldt.Session, 'memo', collections.OrderedDict())
+    monkeypatch.setattr(nldt.Session, 'memo_size', 4)
+    sess = nldt.Session()
+    sess.update('next week')
+    sess.completions()
+    first = next(iter(nldt.Session.memo))
+    sess.update('three days ago')
+    assert len(nldt.Session.memo) == 4
+    assert first not in nldt.Session.memo
+    sess.completions()
+    assert list(nldt.Session.memo)[-1][0] == 'completions'